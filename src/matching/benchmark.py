@@ -0,0 +1,219 @@
+"""Benchmark the matching pipeline stage by stage across roster sizes."""
+
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict
+import numpy as np
+import experiment
+import loader
+import sinkhorn
+from metrics import PipelineMetrics
+
+DEFAULT_SIZES = [100, 1000, 4000, 8400]
+DEFAULT_OUTPUT = Path(__file__).parent / "data" / "benchmark.json"
+
+
+def _run_pipeline(
+    num_students: int,
+    seed: int,
+    method: str,
+    lambda_reg: float,
+    mean_friends: float,
+    dtype: str,
+    trace_memory: bool,
+) -> tuple[Dict[str, Any], list[dict]]:
+    metrics = PipelineMetrics(trace_memory=trace_memory)
+    with metrics.stage("generate"):
+        dataset = sinkhorn.generate_mock_dataset(num_students, seed=seed, mean_friends=mean_friends)
+    with metrics.stage("parse"):
+        table = loader.build_student_table(dataset["students"])
+    with metrics.stage("score"):
+        scores = sinkhorn.score_matrix(table, dtype=dtype)
+    with metrics.stage("sinkhorn"):
+        result = sinkhorn.solve_sinkhorn(scores, table, lambda_reg=lambda_reg, method=method, lazy=True, dtype=dtype)
+    with metrics.stage("extract"):
+        matches = experiment.extract_matches(result.plan, table)
+    row = {
+        "num_students": num_students,
+        "seed": seed,
+        "dtype": dtype,
+        "sinkhorn_method": result.method,
+        "sinkhorn_dtype": str(result.v.dtype),
+        "sinkhorn_iterations": result.iterations,
+        "sinkhorn_converged": result.converged,
+        "total_matches": len(matches),
+        "stages": metrics.stages,
+    }
+    return row, matches
+
+
+def match_drift(reference: list[dict], matches: list[dict]) -> Dict[str, Any]:
+    """How far matches moved from reference matches of the same roster."""
+    def pairs(records: list[dict]) -> set[frozenset]:
+        return {frozenset((m["student_a_id"], m["student_b_id"])) for m in records}
+
+    def partners(records: list[dict]) -> Dict[str, set]:
+        found: Dict[str, set] = {}
+        for m in records:
+            found.setdefault(m["student_a_id"], set()).add(m["student_b_id"])
+            found.setdefault(m["student_b_id"], set()).add(m["student_a_id"])
+        return found
+
+    before, after = pairs(reference), pairs(matches)
+    old, new = partners(reference), partners(matches)
+    changed = len(before - after)
+    return {
+        "changed_matches": changed,
+        "changed_fraction": changed / len(before) if before else 0.0,
+        "reassigned_students": sum(old.get(s) != new.get(s) for s in old.keys() | new.keys()),
+    }
+
+
+def _measure(
+    num_students: int,
+    seed: int,
+    method: str,
+    lambda_reg: float,
+    mean_friends: float,
+    dtype: str,
+    memory: bool,
+) -> tuple[Dict[str, Any], list[dict]]:
+    """Time the pipeline untraced, then, if memory is set, rerun it under tracemalloc for stage peaks."""
+    row, matches = _run_pipeline(num_students, seed, method, lambda_reg, mean_friends, dtype, trace_memory=False)
+    if memory:
+        traced, _ = _run_pipeline(num_students, seed, method, lambda_reg, mean_friends, dtype, trace_memory=True)
+        for stage, record in row["stages"].items():
+            record["peak_mb"] = traced["stages"][stage]["peak_mb"]
+    return row, matches
+
+
+def benchmark_size(
+    num_students: int,
+    seed: int,
+    method: str = "linear",
+    lambda_reg: float = 1.0,
+    mean_friends: float = 0.0,
+    dtype: str = "float64",
+    memory: bool = True,
+) -> Dict[str, Any]:
+    """
+    Time generate, parse, score, Sinkhorn and extraction for one roster size.
+
+    Stage times come from a run without tracemalloc, whose per-allocation
+    hooks would slow the Python-heavy stages. With memory set, a second run
+    of the same seed under tracemalloc adds each stage's peak_mb; NumPy
+    reports its buffers to tracemalloc, so the peak covers both Python
+    objects and arrays.
+    Below float64, the same seed is also run in float64; its stages go under
+    'float64' and the drift of the extracted matches under 'drift'.
+    """
+    row, matches = _measure(num_students, seed, method, lambda_reg, mean_friends, dtype, memory)
+    if np.dtype(dtype) != np.float64:
+        reference, reference_matches = _measure(num_students, seed, method, lambda_reg, mean_friends, "float64", memory)
+        row["float64"] = {key: reference[key] for key in ("sinkhorn_iterations", "total_matches", "stages")}
+        row["drift"] = match_drift(reference_matches, matches)
+    return row
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    sizes: list[int],
+    seed: int,
+    method: str = "linear",
+    lambda_reg: float = 1.0,
+    mean_friends: float = 0.0,
+    dtype: str = "float64",
+    memory: bool = True,
+) -> Dict[str, Any]:
+    """Benchmark every size and return a JSON-serializable report."""
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "method": method,
+        "lambda_reg": lambda_reg,
+        "mean_friends": mean_friends,
+        "dtype": dtype,
+        "memory": memory,
+        "results": [benchmark_size(n, seed, method, lambda_reg, mean_friends, dtype, memory) for n in sizes],
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """Render per-stage time ratios (current / baseline) for sizes present in both reports."""
+    previous = {row["num_students"]: row for row in baseline["results"]}
+    lines = [f"Compared with {baseline.get('commit') or 'baseline'} (ratio > 1 is slower)"]
+    for row in current["results"]:
+        old = previous.get(row["num_students"])
+        if old is None:
+            continue
+        ratios = "  ".join(
+            f"{stage}={timing['seconds'] / old['stages'][stage]['seconds']:.2f}x"
+            for stage, timing in row["stages"].items()
+            if stage in old["stages"] and old["stages"][stage]["seconds"] > 0
+        )
+        lines.append(f"  n={row['num_students']}: {ratios}")
+    return "\n".join(lines)
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render a benchmark report as a fixed-width table."""
+    lines = [f"{'n':>6}  {'stage':<10}{'seconds':>10}{'peak MB':>10}"]
+    for row in report["results"]:
+        for stage, timing in row["stages"].items():
+            peak = f"{timing['peak_mb']:>10.1f}" if "peak_mb" in timing else f"{'-':>10}"
+            lines.append(f"{row['num_students']:>6}  {stage:<10}{timing['seconds']:>10.3f}{peak}")
+        lines.append(f"{'':>6}  sinkhorn iterations: {row['sinkhorn_iterations']}, matches: {row['total_matches']}")
+        if "float64" in row:
+            reference = row["float64"]["stages"]
+            ratios = "  ".join(
+                f"{stage}={timing['seconds'] / reference[stage]['seconds']:.2f}x"
+                + (f"/{timing['peak_mb'] / reference[stage]['peak_mb']:.2f}x" if reference[stage].get("peak_mb") else "")
+                for stage, timing in row["stages"].items()
+                if stage in ("score", "sinkhorn", "extract") and reference[stage]["seconds"] > 0
+            )
+            drift = row["drift"]
+            label = "time/peak" if report.get("memory", True) else "time"
+            lines.append(f"{'':>6}  vs float64 ({label}): {ratios}")
+            lines.append(f"{'':>6}  drift: {drift['changed_matches']}/{row['float64']['total_matches']} matches "
+                         f"({drift['changed_fraction']:.1%}), {drift['reassigned_students']} students reassigned")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Roster sizes to benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for generate_mock_dataset")
+    parser.add_argument("--method", default="linear", help="sinkhorn_matching method")
+    parser.add_argument("--lambda-reg", type=float, default=1.0)
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="Precision of scoring and Sinkhorn; float32 also reports speed, memory and match drift vs float64")
+    parser.add_argument("--mean-friends", type=float, default=0.0, help="Average close_friends per generated student")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass that measures stage peaks")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="Where to write the JSON results")
+    parser.add_argument("--compare", type=Path, help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.seed, args.method, args.lambda_reg, args.mean_friends, args.dtype, not args.no_memory)
+    print(format_report(report))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nSaved results to {args.output}")
+    if args.compare:
+        with args.compare.open("r", encoding="utf-8") as fh:
+            print(compare(json.load(fh), report))
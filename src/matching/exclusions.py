@@ -0,0 +1,96 @@
+"""Precomputed index of student pairs that must never be matched."""
+
+from __future__ import annotations
+
+from typing import Iterable
+import numpy as np
+from student import Student, StudentTable, lookup_row, row_lookup
+
+
+class ExclusionIndex:
+    """
+    Forbidden pairs stored as row-index edge lists.
+
+    Students are addressed by id, email or bare handle (see normalize_key). Pairs are symmetric:
+    excluding (a, b) also excludes (b, a). Whole students can be excluded as
+    well, which forbids every pair involving them.
+    """
+
+    def __init__(self, students: list[Student] | StudentTable):
+        if isinstance(students, StudentTable):
+            ids, emails = students.ids, students.emails
+        else:
+            ids = [student.id for student in students]
+            emails = [student.email for student in students]
+        self.size = len(ids)
+        self.rows_by_key = row_lookup(ids, emails)
+        self._rows: list[np.ndarray] = []
+        self._cols: list[np.ndarray] = []
+        self.blocked = np.zeros(self.size, dtype=bool)
+
+    @classmethod
+    def from_students(cls, students: list[Student] | StudentTable) -> ExclusionIndex:
+        """Build an index excluding every pair where one lists the other as a close friend."""
+        index = cls(students)
+        if isinstance(students, StudentTable):
+            index.add_edges(*students.friend_edges())
+        else:
+            index.add_close_friends(students)
+        return index
+
+    def _row(self, key: str) -> int | None:
+        return lookup_row(self.rows_by_key, key)
+
+    def add_pairs(self, pairs: Iterable[tuple[str, str]]) -> None:
+        """Exclude pairs of student ids/emails; pairs naming unknown students are ignored."""
+        rows, cols = [], []
+        for key_a, key_b in pairs:
+            row_a, row_b = self._row(key_a), self._row(key_b)
+            if row_a is not None and row_b is not None:
+                rows.append(row_a)
+                cols.append(row_b)
+        self.add_edges(np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp))
+
+    def add_edges(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        """Exclude pairs given directly as row indices."""
+        self._rows.append(np.asarray(rows, dtype=np.intp))
+        self._cols.append(np.asarray(cols, dtype=np.intp))
+
+    def add_close_friends(self, students: list[Student]) -> None:
+        """Exclude each student from every entry of their close_friends list."""
+        self.add_pairs(
+            (student.id, friend)
+            for student in students
+            for friend in student.close_friends or ()
+        )
+
+    def exclude_students(self, keys: Iterable[str]) -> None:
+        """Exclude every pair involving the given student ids/emails."""
+        for key in keys:
+            row = self._row(key)
+            if row is not None:
+                self.blocked[row] = True
+
+    def edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the symmetric (rows, cols) edge list of excluded pairs."""
+        rows = np.concatenate(self._rows) if self._rows else np.empty(0, dtype=np.intp)
+        cols = np.concatenate(self._cols) if self._cols else np.empty(0, dtype=np.intp)
+        return np.concatenate([rows, cols]), np.concatenate([cols, rows])
+
+    def apply(self, cost_matrix: np.ndarray, value: float = np.inf) -> np.ndarray:
+        """
+        Set the cost of self-pairs and excluded pairs to value, in place.
+
+        Args:
+            cost_matrix: n x n cost matrix in the same student order as the index
+            value: Cost written for forbidden pairs
+
+        Returns:
+            The same cost_matrix, for chaining
+        """
+        rows, cols = self.edges()
+        cost_matrix[rows, cols] = value
+        cost_matrix[self.blocked, :] = value
+        cost_matrix[:, self.blocked] = value
+        np.fill_diagonal(cost_matrix, value)
+        return cost_matrix
@@ -1,104 +1,295 @@
 """Mock experiment for testing Sinkhorn matching algorithm."""
 
+import argparse
+import cProfile
 import json
+import resource
+import sys
 from pathlib import Path
-import matplotlib.pyplot as plt
+from typing import Any, Callable, Dict
 import numpy as np
 import loader
+import roster
 import sinkhorn
+from groups import form_groups
+from metrics import PipelineMetrics
+from student import StudentTable
 
 
-def extract_matches(matching_matrix: np.ndarray, students: list) -> list[dict]:
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _top_candidates(
+    matching_matrix: Any,
+    used: np.ndarray,
+    top_k: int,
+    block_size: int,
+    taken: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """
+    Collect the top_k highest-probability pairs of every unmatched student.
+    
+    taken holds the (rows, cols) of pairs already matched, which are skipped.
+
+    Returns:
+        (rows, cols, probs) of the candidates with positive probability among
+        unmatched students, and the largest probability any pair left out of
+        the candidates can have
+    """
+    n = len(used)
+    k = min(top_k, n)
+    rows, cols, probs = [], [], []
+    unseen_bound = 0.0
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        if used[start:stop].all():
+            continue
+        block = sinkhorn.plan_rows(matching_matrix, start, stop)
+        block[used[start:stop], :] = 0.0
+        block[:, used] = 0.0
+        block[np.arange(stop - start), np.arange(start, stop)] = 0.0
+        if taken is not None:
+            in_block = (taken[0] >= start) & (taken[0] < stop)
+            block[taken[0][in_block] - start, taken[1][in_block]] = 0.0
+
+        block_cols = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        block_probs = np.take_along_axis(block, block_cols, axis=1)
+        # Rows with more positive entries than candidates may hide pairs up
+        # to their smallest kept probability
+        truncated = np.count_nonzero(block > 0, axis=1) > k
+        if truncated.any():
+            unseen_bound = max(unseen_bound, float(block_probs[truncated].min(axis=1).max()))
+
+        positive = block_probs > 0
+        block_rows = np.broadcast_to(np.arange(start, stop)[:, None], block_cols.shape)
+        rows.append(block_rows[positive])
+        cols.append(block_cols[positive])
+        probs.append(block_probs[positive])
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0), 0.0
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(probs), unseen_bound
+
+
+def _match_record(students: list, i: int, j: int, prob: float) -> dict:
+    return {
+        "student_a_id": students[i].id,
+        "student_b_id": students[j].id,
+        "compatibility_score": float(prob),
+        "student_a_name": students[i].first_name or students[i].id,
+        "student_b_name": students[j].first_name or students[j].id,
+    }
+
+
+def extract_matches(
+    matching_matrix: Any,
+    students: list,
+    block_size: int = 1024,
+    method: str = "greedy",
+    top_k: int = 32,
+    capacities: np.ndarray | None = None,
+) -> list[dict]:
     """
     Extract discrete matches from the matching matrix.
-    Uses greedy approach: for each student, find their highest probability match.
+    
+    The default greedy method repeatedly takes the highest probability pair
+    among unmatched students. It works in rounds: each round gathers every
+    unmatched student's top_k pairs with np.argpartition and assigns them in
+    descending order, but only down to the best probability a pair outside
+    the candidates could have, so the result equals a greedy pass over the
+    fully sorted pair list without ever building it.
+    
+    With capacities, student i stays available until they are in
+    capacities[i] matches (0 skips them), and no pair is matched twice, so
+    a plan solved with the same capacities hands out multiple matches in one
+    pass.
+    
+    method="exact" instead computes a maximum-weight matching (blossom
+    algorithm, requires networkx) on the graph of every student's top_k pairs.
+    
+    matching_matrix may be a dense array, a scipy.sparse matrix or a lazy
+    SinkhornPlan; rows are read block by block so the plan never has to be
+    materialized.
     """
+    if method == "exact":
+        if capacities is not None:
+            raise ValueError("capacities require method='greedy'")
+        return _extract_exact_matches(matching_matrix, students, block_size, top_k)
+    if method != "greedy":
+        raise ValueError(f"Unknown extraction method: {method}")
+
     n = len(students)
     matches = []
-    used = set()
+    remaining = np.ones(n, dtype=np.int64) if capacities is None else np.asarray(capacities).astype(np.int64)
+    if remaining.shape != (n,):
+        raise ValueError("capacities must have one value per student")
+    used = remaining <= 0
+    matched_rows, matched_cols = [], []
     
-    # Sort all potential pairs by matching probability
-    pairs = []
-    for i in range(n):
-        for j in range(n):
-            if i != j and matching_matrix[i, j] > 0:
-                pairs.append((i, j, matching_matrix[i, j]))
-    
-    # Sort by probability (descending)
-    pairs.sort(key=lambda x: x[2], reverse=True)
-    
-    # Greedily assign matches
-    for i, j, prob in pairs:
-        if i not in used and j not in used and i != j:
-            matches.append({
-                "student_a_id": students[i].id,
-                "student_b_id": students[j].id,
-                "compatibility_score": float(prob),
-                "student_a_name": students[i].first_name or students[i].id,
-                "student_b_name": students[j].first_name or students[j].id,
-            })
-            used.add(i)
-            used.add(j)
+    while n - used.sum() >= 2:
+        taken = (np.array(matched_rows + matched_cols, dtype=int), np.array(matched_cols + matched_rows, dtype=int))
+        rows, cols, probs, unseen_bound = _top_candidates(matching_matrix, used, top_k, block_size, taken)
+        if len(probs) == 0:
+            break
+        
+        # Sort by probability (descending), keeping row-major order for ties
+        order = np.argsort(-probs, kind="stable")
+        pairs = zip(rows[order].tolist(), cols[order].tolist(), probs[order].tolist())
+        
+        # Greedily assign matches until a pair outside the candidates could win
+        matched = set()
+        for i, j, prob in pairs:
+            if prob < unseen_bound:
+                break
+            if not used[i] and not used[j] and (j, i) not in matched:
+                matches.append(_match_record(students, i, j, prob))
+                matched.add((i, j))
+                matched_rows.append(i)
+                matched_cols.append(j)
+                remaining[i] -= 1
+                remaining[j] -= 1
+                used[i] = remaining[i] <= 0
+                used[j] = remaining[j] <= 0
     
     return matches
 
 
+def _extract_exact_matches(
+    matching_matrix: Any,
+    students: list,
+    block_size: int,
+    top_k: int,
+) -> list[dict]:
+    """Maximum-weight matching over every student's top_k candidate pairs."""
+    import networkx as nx
+
+    n = len(students)
+    rows, cols, probs, _ = _top_candidates(matching_matrix, np.zeros(n, dtype=bool), top_k, block_size)
+    graph = nx.Graph()
+    for i, j, prob in zip(rows.tolist(), cols.tolist(), probs.tolist()):
+        a, b = min(i, j), max(i, j)
+        if prob > graph.get_edge_data(a, b, {"weight": 0.0})["weight"]:
+            graph.add_edge(a, b, weight=prob)
+    matches = [
+        _match_record(students, i, j, graph[i][j]["weight"])
+        for i, j in (sorted(edge) for edge in nx.max_weight_matching(graph))
+    ]
+    matches.sort(key=lambda m: m["compatibility_score"], reverse=True)
+    return matches
+
+
+def block_average(matrix: Any, n: int, resolution: int, block_size: int = 1024) -> np.ndarray:
+    """
+    Downsample an n x n matrix to at most resolution x resolution cells by averaging.
+
+    Rows are read block by block, so dense, sparse and lazy matrices are all
+    reduced without materializing more than block_size rows at once.
+    """
+    bins = min(resolution, n)
+    edges = np.linspace(0, n, bins + 1).astype(int)
+    counts = np.diff(edges)
+    row_bin = np.repeat(np.arange(bins), counts)
+    summed = np.zeros((bins, bins))
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = sinkhorn.plan_rows(matrix, start, stop)
+        block[~np.isfinite(block)] = 0.0
+        np.add.at(summed, row_bin[start:stop], np.add.reduceat(block, edges[:-1], axis=1))
+    return summed / np.outer(counts, counts)
+
+
+def sample_pairs(n: int, max_points: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """All off-diagonal (i, j) pairs if there are at most max_points, else a uniform random sample."""
+    if n * (n - 1) <= max_points:
+        rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+        return rows, cols
+    rows = rng.integers(0, n, size=max_points)
+    cols = rng.integers(0, n - 1, size=max_points)
+    cols += cols >= rows
+    return rows, cols
+
+
 def visualize_results(
     students: list,
     scores: np.ndarray,
-    matching_matrix: np.ndarray,
+    matching_matrix: Any,
     matches: list[dict],
     output_dir: Path,
+    resolution: int = 200,
+    max_points: int = 20000,
+    seed: int = 0,
 ) -> None:
-    """Create visualizations of the matching experiment."""
+    """
+    Create visualizations of the matching experiment.
+    
+    Plotting cost is bounded regardless of roster size: heatmaps are block
+    averaged to at most resolution x resolution cells, and the histograms
+    and scatter use at most max_points (i, j) pairs, sampled uniformly once
+    the roster has more pairs than that. Rendering uses the Agg backend.
+    """
+    # Imported here so headless runs never pay for matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    
     n = len(students)
+    rows, cols = sample_pairs(n, max_points, np.random.default_rng(seed))
+    sampled = n * (n - 1) > max_points
+    pair_scores = sinkhorn.matrix_entries(scores, rows, cols)
+    pair_probs = sinkhorn.matrix_entries(matching_matrix, rows, cols)
+    sample_note = f" ({len(rows)} sampled pairs)" if sampled else ""
+    index_label = 'Student Index (binned)' if n > resolution else 'Student Index'
     
     # Create figure with subplots
-    fig = plt.figure(figsize=(16, 12))
+    fig = Figure(figsize=(16, 12))
+    FigureCanvasAgg(fig)
     
     # 1. Score matrix heatmap
-    ax1 = plt.subplot(2, 3, 1)
-    im1 = ax1.imshow(scores, cmap='viridis', aspect='auto')
+    ax1 = fig.add_subplot(2, 3, 1)
+    im1 = ax1.imshow(block_average(scores, n, resolution), cmap='viridis', aspect='auto', extent=(0, n, n, 0))
     ax1.set_title('Match Score Matrix (Distance)')
-    ax1.set_xlabel('Student Index')
-    ax1.set_ylabel('Student Index')
-    plt.colorbar(im1, ax=ax1)
+    ax1.set_xlabel(index_label)
+    ax1.set_ylabel(index_label)
+    fig.colorbar(im1, ax=ax1)
     
     # 2. Matching matrix heatmap
-    ax2 = plt.subplot(2, 3, 2)
-    im2 = ax2.imshow(matching_matrix, cmap='hot', aspect='auto')
+    ax2 = fig.add_subplot(2, 3, 2)
+    im2 = ax2.imshow(block_average(matching_matrix, n, resolution), cmap='hot', aspect='auto', extent=(0, n, n, 0))
     ax2.set_title('Sinkhorn Matching Matrix (Probabilities)')
-    ax2.set_xlabel('Student Index')
-    ax2.set_ylabel('Student Index')
-    plt.colorbar(im2, ax=ax2)
+    ax2.set_xlabel(index_label)
+    ax2.set_ylabel(index_label)
+    fig.colorbar(im2, ax=ax2)
     
     # 3. Distribution of match scores
-    ax3 = plt.subplot(2, 3, 3)
-    # Filter out infinities and diagonal (self-pairs), but keep zeros as valid scores
-    mask = ~np.isinf(scores)
-    np.fill_diagonal(mask, False)  # Exclude diagonal (self-pairs)
-    valid_scores = scores[mask]
+    ax3 = fig.add_subplot(2, 3, 3)
+    # Filter out infinities; self-pairs are never sampled, zeros are valid scores
+    valid_scores = pair_scores[~np.isinf(pair_scores)]
     if len(valid_scores) > 0:
         ax3.hist(valid_scores, bins=30, edgecolor='black', alpha=0.7)
-        ax3.set_title('Distribution of Match Scores')
+        ax3.set_title('Distribution of Match Scores' + sample_note)
         ax3.set_xlabel('Match Score')
         ax3.set_ylabel('Frequency')
     
     # 4. Distribution of matching probabilities
-    ax4 = plt.subplot(2, 3, 4)
-    valid_probs = matching_matrix[matching_matrix > 0]
+    ax4 = fig.add_subplot(2, 3, 4)
+    valid_probs = pair_probs[pair_probs > 0]
     if len(valid_probs) > 0:
         ax4.hist(valid_probs, bins=30, edgecolor='black', alpha=0.7, color='orange')
-        ax4.set_title('Distribution of Matching Probabilities')
+        ax4.set_title('Distribution of Matching Probabilities' + sample_note)
         ax4.set_xlabel('Matching Probability')
         ax4.set_ylabel('Frequency')
     
     # 5. Number of close friends per student
-    ax5 = plt.subplot(2, 3, 5)
-    friend_counts = [
-        len(s.close_friends) if s.close_friends else 0
-        for s in students
-    ]
+    ax5 = fig.add_subplot(2, 3, 5)
+    if isinstance(students, StudentTable):
+        friend_counts = np.diff(students.friend_indptr)
+    else:
+        friend_counts = [
+            len(s.close_friends) if s.close_friends else 0
+            for s in students
+        ]
     ax5.hist(friend_counts, bins=20, edgecolor='black', alpha=0.7, color='green')
     ax5.set_title('Distribution of Close Friends per Student')
     ax5.set_xlabel('Number of Close Friends')
@@ -108,88 +299,128 @@ def visualize_results(
     ax5.legend()
     
     # 6. Matching probability vs match score scatter
-    ax6 = plt.subplot(2, 3, 6)
-    probs = []
-    scrs = []
-    for i in range(n):
-        for j in range(n):
-            if i != j and scores[i, j] != np.inf and matching_matrix[i, j] > 0:
-                probs.append(matching_matrix[i, j])
-                scrs.append(scores[i, j])
-    if len(probs) > 0:
-        ax6.scatter(scrs, probs, alpha=0.5, s=10)
-        ax6.set_title('Matching Probability vs Match Score')
+    ax6 = fig.add_subplot(2, 3, 6)
+    keep = ~np.isinf(pair_scores) & (pair_probs > 0)
+    if keep.any():
+        ax6.scatter(pair_scores[keep], pair_probs[keep], alpha=0.5, s=10)
+        ax6.set_title('Matching Probability vs Match Score' + sample_note)
         ax6.set_xlabel('Match Score (Distance)')
         ax6.set_ylabel('Matching Probability')
         ax6.set_yscale('log')
     
-    plt.tight_layout()
-    plt.savefig(output_dir / 'matching_analysis.png', dpi=150, bbox_inches='tight')
+    fig.tight_layout()
+    fig.savefig(output_dir / 'matching_analysis.png', dpi=150, bbox_inches='tight')
     print(f"Saved visualization to {output_dir / 'matching_analysis.png'}")
-    plt.close()
 
 
-if __name__ == "__main__":
-    # Configuration
-    num_students = 100
-    seed = 42
-    output_dir = Path(__file__).parent / "data"
-    matches_output_file = output_dir / "matches.json"
-    mock_dataset_file = output_dir / "mock_dataset.json"
-    
-    # Set to True to load from file, False to generate new
-    load_from_file = False
-    
-    print("=" * 60)
-    print("Sinkhorn Matching Experiment")
-    print("=" * 60)
-    
-    # Step 1: Generate or load mock dataset
-    if load_from_file:
-        print(f"\n1. Loading mock dataset from {mock_dataset_file}...")
-        try:
-            dataset = loader.load_mock_dataset(mock_dataset_file)
-            print(f"   Loaded {len(dataset['students'])} students from file")
-        except FileNotFoundError:
-            print(f"   File not found, generating new dataset...")
-            dataset = sinkhorn.generate_mock_dataset(
-                num_students=num_students,
-                seed=seed,
-            )
-            print(f"   Generated {len(dataset['students'])} students")
-            loader.save_mock_dataset(dataset, mock_dataset_file)
-            print(f"   Saved dataset to {mock_dataset_file}")
+DEFAULT_OUTPUT_DIR = Path(__file__).parent / "data"
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "num_students": 100,
+    "seed": 42,
+    "output_dir": DEFAULT_OUTPUT_DIR,
+    "matches_output_file": DEFAULT_OUTPUT_DIR / "matches.json",
+    "dataset_file": DEFAULT_OUTPUT_DIR / "mock_dataset.json",
+    # True to load the dataset file, False to generate a new one
+    "load_from_file": False,
+    # Processes used to compute the score matrix
+    "workers": 1,
+    # True to run Sinkhorn on a memory-mapped scratch matrix in "dtype"
+    "use_memmap": False,
+    "scratch_file": DEFAULT_OUTPUT_DIR / "sinkhorn_scratch.mmap",
+    # "float32" to score and solve in single precision (half the memory). From
+    # about lambda_reg 20 too many kernel entries would be subnormal, and the
+    # linear solver builds its kernel in float64 instead
+    "dtype": "float64",
+    "method": "linear",
+    "lambda_reg": 1.0,
+    "max_iterations": 1000,
+    "tolerance": 1e-6,
+    # Check convergence on the observed error trend instead of every 10
+    # iterations, and stop after this many checks without progress (None: never)
+    "adaptive_stopping": False,
+    "stall_patience": None,
+    # Per-student match counts wanted this round (array in dataset order;
+    # None for one each), and an optional KL relaxation of those marginals
+    "capacities": None,
+    "marginal_penalty": None,
+    # Also split the roster into groups (pods) of about this many students
+    "group_size": None,
+    "visualize": False,
+    # Also record each stage's tracemalloc peak (slows the timed stages)
+    "trace_memory": False,
+    # "json" (indented), "compact" (no whitespace) or "ndjson" (one match per line)
+    "output_format": "json",
+}
+
+OUTPUT_FORMATS = ("json", "compact", "ndjson")
+
+
+def prepare_dataset(config: Dict[str, Any]) -> None:
+    """Step 1: Generate the mock dataset unless reusing the one on disk."""
+    dataset_file = config["dataset_file"]
+    if config["load_from_file"] and dataset_file.exists():
+        print(f"\n1. Using mock dataset at {dataset_file}...")
+        return
+    if config["load_from_file"]:
+        print(f"   File not found, generating new dataset...")
+    print(f"\n1. Generating mock dataset with {config['num_students']} students...")
+    dataset = sinkhorn.generate_mock_dataset(
+        num_students=config["num_students"],
+        seed=config["seed"],
+    )
+    print(f"   Generated {len(dataset['students'])} students")
+    if loader.save_mock_dataset(dataset, dataset_file):
+        print(f"   Saved dataset to {dataset_file}")
     else:
-        print(f"\n1. Generating mock dataset with {num_students} students...")
-        dataset = sinkhorn.generate_mock_dataset(
-            num_students=num_students,
-            seed=seed,
-        )
-        print(f"   Generated {len(dataset['students'])} students")
-        loader.save_mock_dataset(dataset, mock_dataset_file)
-        print(f"   Saved dataset to {mock_dataset_file}")
-    
-    # Step 2: Parse students
+        print(f"   {dataset_file} already holds this dataset, left unchanged")
+
+
+def load_students(config: Dict[str, Any]) -> tuple[StudentTable, str]:
+    """
+    Step 2: Parse students, through the table cache next to the dataset file.
+
+    Friend names are resolved against the roster CSV when it exists.
+
+    Returns:
+        (students, sha1 of the dataset file)
+    """
     print("\n2. Parsing students...")
-    parsed_students = []
-    for student in dataset["students"]:
-        parsed_student = loader.parse_student(student)
-        parsed_students.append(parsed_student)
-    print(f"   Parsed {len(parsed_students)} students")
-    
-    # Step 3: Calculate match scores
+    index = roster.load_roster_index() if roster.ROSTER_FILE.exists() else None
+    students, source_sha1 = loader.load_table_cached(config["dataset_file"], roster=index)
+    print(f"   Parsed {len(students)} students")
+    return students, source_sha1
+
+
+def score_students(
+    students: StudentTable,
+    source_sha1: str,
+    config: Dict[str, Any],
+    metrics: PipelineMetrics,
+) -> np.ndarray:
+    """
+    Step 3: Calculate match scores, or reuse the score cache of an unchanged dataset.
+
+    A cache hit is timed as its own "score_cache_hit" stage, so it is never
+    mistaken for a fast "score".
+    """
     print("\n3. Calculating match scores...")
-    scores = np.zeros((len(parsed_students), len(parsed_students)))
-    for i, student_a in enumerate(parsed_students):
-        for j, student_b in enumerate(parsed_students):
-            if student_a.id != student_b.id:
-                score = sinkhorn.match_score(student_a, student_b)
-                scores[i, j] = score
-    
-    # Calculate statistics
-    # Filter out infinities and diagonal (self-pairs), but keep zeros as valid scores
+    scores_path = loader.scores_cache_path(config["dataset_file"], source_sha1, dtype=config["dtype"])
+    if scores_path.exists():
+        with metrics.stage("score_cache_hit"):
+            scores = np.load(scores_path, mmap_mode="r")
+        print(f"   Reused cached scores from {scores_path.name}")
+    else:
+        with metrics.stage("score"):
+            scores = sinkhorn.score_matrix(students, workers=config["workers"], dtype=config["dtype"])
+        loader.save_scores_cache(config["dataset_file"], source_sha1, scores)
+    return scores
+
+
+def valid_score_values(scores: np.ndarray) -> np.ndarray:
+    """Scores excluding infinities and the diagonal (self-pairs), but keeping zeros."""
     mask = ~np.isinf(scores)
-    np.fill_diagonal(mask, False)  # Exclude diagonal (self-pairs)
+    np.fill_diagonal(mask, False)
     valid_scores = scores[mask]
     print(f"   Computed {len(valid_scores)} match scores")
     if len(valid_scores) > 0:
@@ -197,60 +428,276 @@ if __name__ == "__main__":
         print(f"   Mean score: {np.mean(valid_scores):.2f}")
     else:
         print("   Warning: No valid scores computed (all scores are zero or invalid)")
-    
-    # Step 4: Apply Sinkhorn matching
+    return valid_scores
+
+
+def run_sinkhorn(
+    scores: np.ndarray,
+    students: StudentTable,
+    config: Dict[str, Any],
+    callback: Callable[[int, float], None] | None = None,
+) -> sinkhorn.SinkhornResult:
+    """Step 4: Apply Sinkhorn matching; warns when the solver did not converge."""
     print("\n4. Applying Sinkhorn matching algorithm...")
-    matching_matrix = sinkhorn.sinkhorn_matching(
-        scores,
-        parsed_students,
-        lambda_reg=1.0,
-        max_iterations=1000,
-        tolerance=1e-6,
+    if config["use_memmap"]:
+        # Solve on a scratch copy that is turned into the kernel and plan in
+        # place, leaving the cached scores intact for visualization
+        work = sinkhorn.matrix_buffer(len(students), config["dtype"], config["scratch_file"])
+        work[:] = scores
+    else:
+        work = scores
+    result = sinkhorn.solve_sinkhorn(
+        work,
+        students,
+        lambda_reg=config["lambda_reg"],
+        max_iterations=config["max_iterations"],
+        tolerance=config["tolerance"],
+        method=config["method"],
+        in_place=config["use_memmap"],
+        callback=callback,
+        capacities=config["capacities"],
+        marginal_penalty=config["marginal_penalty"],
+        adaptive=config["adaptive_stopping"],
+        stall_patience=config["stall_patience"],
+        dtype=config["dtype"],
     )
+    matching_matrix = result.plan
+    if result.v.dtype != work.dtype:
+        print(f"   Kernel underflows in {work.dtype}; solved in {result.v.dtype} instead")
+    if result.converged:
+        print(f"   Converged after {result.iterations} iterations (max marginal error {result.marginal_error:.2e})")
+    else:
+        reason = "stalled" if result.stalled else "hit max_iterations"
+        print(f"   Warning: Sinkhorn did not converge ({reason} after {result.iterations} iterations, "
+              f"max marginal error {result.marginal_error:.2e} > tolerance {config['tolerance']:g})")
     print(f"   Matching matrix shape: {matching_matrix.shape}")
-    print(f"   Matrix sum: {matching_matrix.sum():.2f} (expected ~{len(parsed_students)})")
-    print(f"   Non-zero entries: {np.count_nonzero(matching_matrix)}")
-    
-    # Step 5: Extract discrete matches
-    print("\n5. Extracting discrete matches...")
-    matches = extract_matches(matching_matrix, parsed_students)
+    expected = len(students) if config["capacities"] is None else float(np.sum(config["capacities"]))
+    print(f"   Matrix sum: {matching_matrix.sum():.2f} (expected ~{expected:g})")
+    print(f"   Non-zero entries: {len(positive_values(matching_matrix))}")
+    return result
+
+
+def positive_values(matching_matrix: Any) -> np.ndarray:
+    """Positive entries of a dense or scipy.sparse matching matrix."""
+    values = matching_matrix.data if hasattr(matching_matrix, "nnz") else matching_matrix
+    return values[values > 0]
+
+
+def save_output(output_data: Dict[str, Any], path: Path, output_format: str = "json") -> None:
+    """Write the experiment output as indented JSON, compact JSON, or NDJSON matches."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        if output_format == "json":
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        elif output_format == "compact":
+            json.dump(output_data, f, separators=(",", ":"), ensure_ascii=False)
+        elif output_format == "ndjson":
+            for match in output_data["matches"]:
+                f.write(json.dumps(match, separators=(",", ":"), ensure_ascii=False))
+                f.write("\n")
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+
+def report_matches(matches: list[dict], num_students: int) -> None:
+    """Print match coverage and the top 10 matches by probability."""
     print(f"   Found {len(matches)} matched pairs")
-    print(f"   Coverage: {len(matches) * 2}/{len(parsed_students)} students matched")
-    
-    # Display top matches
+    print(f"   Coverage: {len(matches) * 2}/{num_students} students matched")
     if matches:
         print("\n   Top 10 matches by probability:")
         sorted_matches = sorted(matches, key=lambda x: x["compatibility_score"], reverse=True)
         for i, match in enumerate(sorted_matches[:10], 1):
             print(f"   {i}. {match['student_a_name']} <-> {match['student_b_name']} "
                   f"(score: {match['compatibility_score']:.4f})")
+
+
+def report_groups(groups: list[dict], num_students: int) -> None:
+    """Print group coverage and the top 5 groups by mean pairwise probability."""
+    print(f"   Formed {len(groups)} groups")
+    print(f"   Coverage: {sum(g['size'] for g in groups)}/{num_students} students grouped")
+    for i, group in enumerate(groups[:5], 1):
+        print(f"   {i}. {', '.join(group['member_names'])} (score: {group['compatibility_score']:.4f})")
+
+
+def run_experiment(
+    config: Dict[str, Any] | None = None,
+    metrics: PipelineMetrics | None = None,
+) -> Dict[str, Any]:
+    """
+    Run the full pipeline, wrapping each stage in metrics.stage().
+    
+    Args:
+        config: Overrides for DEFAULT_CONFIG
+        metrics: Hook receiving stage timings and Sinkhorn marginal errors
+            (defaults to a PipelineMetrics tracing memory if config["trace_memory"])
+    
+    Returns:
+        The output written to matches_output_file, whose statistics include
+        a 'timings' section
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    metrics = PipelineMetrics(trace_memory=config["trace_memory"]) if metrics is None else metrics
+    
+    with metrics.stage("dataset"):
+        prepare_dataset(config)
+    with metrics.stage("load_table"):
+        students, source_sha1 = load_students(config)
+    scores = score_students(students, source_sha1, config, metrics)
+    valid_scores = valid_score_values(scores)
+    with metrics.stage("sinkhorn"):
+        solution = run_sinkhorn(scores, students, config, callback=metrics.sinkhorn_iteration)
+    matching_matrix = solution.plan
+    
+    # Step 5: Extract discrete matches
+    print("\n5. Extracting discrete matches...")
+    with metrics.stage("extract"):
+        matches = extract_matches(matching_matrix, students, capacities=config["capacities"])
+    report_matches(matches, len(students))
+    
+    groups = None
+    if config["group_size"]:
+        print(f"\n5b. Forming groups of about {config['group_size']}...")
+        with metrics.stage("groups"):
+            groups = form_groups(matching_matrix, students, group_size=config["group_size"])
+        report_groups(groups, len(students))
     
     # Step 6: Create visualizations
-    print("\n6. Creating visualizations...")
-    visualize_results(parsed_students, scores, matching_matrix, matches, output_dir)
+    if config["visualize"]:
+        print("\n6. Creating visualizations...")
+        with metrics.stage("visualize"):
+            visualize_results(students, scores, matching_matrix, matches, config["output_dir"])
     
     # Step 7: Save matches to JSON
+    matches_output_file = config["matches_output_file"]
     print(f"\n7. Saving matches to {matches_output_file}...")
+    probabilities = positive_values(matching_matrix)
     output_data = {
         "experiment_config": {
-            "num_students": num_students,
-            "seed": seed,
-            "lambda_reg": 1.0,
+            "num_students": len(students),
+            "seed": config["seed"],
+            "method": config["method"],
+            "lambda_reg": config["lambda_reg"],
+            "tolerance": config["tolerance"],
+            "dtype": config["dtype"],
         },
         "statistics": {
-            "total_students": len(parsed_students),
+            "total_students": len(students),
             "total_matches": len(matches),
-            "coverage_percentage": (len(matches) * 2 / len(parsed_students)) * 100,
+            "coverage_percentage": (len(matches) * 2 / len(students)) * 100,
             "mean_match_score": float(np.mean(valid_scores)) if len(valid_scores) > 0 else 0.0,
-            "mean_matching_probability": float(np.mean(matching_matrix[matching_matrix > 0])) if np.count_nonzero(matching_matrix) > 0 else 0.0,
+            "mean_matching_probability": float(np.mean(probabilities)) if len(probabilities) > 0 else 0.0,
+            "sinkhorn_converged": solution.converged,
+            "sinkhorn_iterations": solution.iterations,
+            "sinkhorn_marginal_error": solution.marginal_error,
+            "sinkhorn_marginal_errors": [[i, e] for i, e in metrics.sinkhorn_errors],
+            "timings": metrics.timings(),
         },
         "matches": matches,
     }
+    if groups is not None:
+        output_data["experiment_config"]["group_size"] = config["group_size"]
+        output_data["statistics"]["total_groups"] = len(groups)
+        output_data["groups"] = groups
+    
+    save_output(output_data, matches_output_file, config["output_format"])
+    print(f"   Saved {len(matches)} matches as {config['output_format']}")
+    
+    print("\n   Stage timings:")
+    for stage, record in output_data["statistics"]["timings"].items():
+        peak = f", peak {record['peak_mb']:.1f} MB allocated" if "peak_mb" in record else ""
+        print(f"   {stage:<16}{record['seconds']:>9.3f} s{peak}")
+    print(f"\nPeak RSS: {peak_rss_mb():.1f} MB")
+    return output_data
+
+
+def parse_args(argv: list[str] | None = None) -> tuple[Dict[str, Any], Path | None]:
+    """Parse command-line arguments into a run_experiment config and an optional profile path."""
+    parser = argparse.ArgumentParser(description="Run the Sinkhorn matching pipeline.")
+    parser.add_argument(
+        "--dataset",
+        type=Path,
+        help="Dataset to match (JSON with a 'students' array, or NDJSON); "
+             "without it a mock dataset is generated",
+    )
+    parser.add_argument("--num-students", type=int, default=DEFAULT_CONFIG["num_students"], help="Size of a generated mock dataset")
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"], help="Seed for a generated mock dataset")
+    parser.add_argument("--method", choices=("linear", "log", "sparse"), default=DEFAULT_CONFIG["method"], help="Sinkhorn solver mode")
+    parser.add_argument("--lambda-reg", type=float, default=DEFAULT_CONFIG["lambda_reg"])
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_CONFIG["tolerance"])
+    parser.add_argument("--max-iterations", type=int, default=DEFAULT_CONFIG["max_iterations"])
+    parser.add_argument("--adaptive-stopping", action="store_true", help="Schedule Sinkhorn convergence checks from the error trend")
+    parser.add_argument("--stall-patience", type=int, help="Stop Sinkhorn after this many convergence checks without progress")
+    parser.add_argument("--marginal-penalty", type=float, help="Relax the Sinkhorn marginals to a KL penalty of this strength")
+    parser.add_argument("--workers", type=int, default=DEFAULT_CONFIG["workers"], help="Processes used for scoring")
+    parser.add_argument(
+        "--dtype",
+        choices=("float64", "float32"),
+        help=f"Precision of scoring and Sinkhorn (default: float32 with --memmap, else {DEFAULT_CONFIG['dtype']})",
+    )
+    parser.add_argument("--memmap", action="store_true", help="Solve on a memory-mapped scratch matrix in --dtype")
+    parser.add_argument("--output", type=Path, default=DEFAULT_CONFIG["matches_output_file"], help="Where to write the matches")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=DEFAULT_CONFIG["output_format"], help="Output format")
+    parser.add_argument("--group-size", type=int, help="Also form groups (pods) of about this many students")
+    parser.add_argument("--visualize", action="store_true", help="Also plot matching_analysis.png next to the output (imports matplotlib)")
+    parser.add_argument("--trace-memory", action="store_true", help="Record each stage's tracemalloc peak (slows the timings)")
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Write cProfile stats to this file (view with snakeviz, or convert to a flamegraph with flameprof)",
+    )
+    args = parser.parse_args(argv)
+    
+    if args.dataset is not None and not args.dataset.exists():
+        parser.error(f"dataset not found: {args.dataset}")
+    output_dir = args.output.parent
+    config = {
+        "num_students": args.num_students,
+        "seed": args.seed,
+        "output_dir": output_dir,
+        "matches_output_file": args.output,
+        "dataset_file": args.dataset if args.dataset is not None else DEFAULT_CONFIG["dataset_file"],
+        "load_from_file": args.dataset is not None,
+        "workers": args.workers,
+        "use_memmap": args.memmap,
+        "dtype": args.dtype or ("float32" if args.memmap else DEFAULT_CONFIG["dtype"]),
+        "scratch_file": output_dir / "sinkhorn_scratch.mmap",
+        "method": args.method,
+        "lambda_reg": args.lambda_reg,
+        "max_iterations": args.max_iterations,
+        "tolerance": args.tolerance,
+        "adaptive_stopping": args.adaptive_stopping,
+        "stall_patience": args.stall_patience,
+        "marginal_penalty": args.marginal_penalty,
+        "group_size": args.group_size,
+        "visualize": args.visualize,
+        "trace_memory": args.trace_memory,
+        "output_format": args.format,
+    }
+    return config, args.profile
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point."""
+    config, profile_path = parse_args(argv)
     
-    with matches_output_file.open("w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
-    print(f"   Saved {len(matches)} matches to JSON")
+    print("=" * 60)
+    print("Sinkhorn Matching Experiment")
+    print("=" * 60)
+    
+    if profile_path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        run_experiment(config)
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        print(f"\nSaved profile to {profile_path}")
+    else:
+        run_experiment(config)
     
     print("\n" + "=" * 60)
     print("Experiment completed successfully!")
     print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
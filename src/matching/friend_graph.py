@@ -0,0 +1,207 @@
+"""Friendship graph built from close_friends lists and mutual_friends_*.txt snapshots."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable
+import numpy as np
+from student import Student, StudentTable, lookup_row, normalize_key, row_lookup
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def snapshot_paths(data_dir: Path = DATA_DIR) -> list[Path]:
+    """mutual_friends_*.txt snapshots in data_dir, oldest first (names sort by timestamp)."""
+    return sorted(data_dir.glob("mutual_friends_*.txt"), key=lambda path: path.name)
+
+
+class FriendGraph:
+    """
+    Undirected friendship graph as a CSR adjacency over interned node ids.
+
+    Nodes 0..n-1 are the roster rows, so neighbor indices can be used
+    directly against score and cost matrices. People named in close_friends
+    lists or snapshots who are not on the roster are interned after them
+    (by normalize_key), so friendships through them still count for
+    friends-of-friends queries, whether the roster is a list of students or
+    a StudentTable.
+
+    Snapshots are the email lists saved by dataAccess.ts; each is stored as
+    the sorted node ids it names, keyed by file stem.
+    """
+
+    def __init__(self, students: list[Student] | StudentTable):
+        if isinstance(students, StudentTable):
+            ids, emails = students.ids, students.emails
+        else:
+            ids = [student.id for student in students]
+            emails = [student.email for student in students]
+        self.size = len(ids)
+        # Email (or id, without one) of every node
+        self.keys = [normalize_key(email) if email else student_id for student_id, email in zip(ids, emails)]
+        self.rows_by_key = row_lookup(ids, emails)
+        self._external: dict[str, int] = {}
+        self._rows: list[np.ndarray] = []
+        self._cols: list[np.ndarray] = []
+        self._csr: tuple[np.ndarray, np.ndarray] | None = None
+        self.snapshots: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def build(
+        cls,
+        students: list[Student] | StudentTable,
+        snapshots: Iterable[Path] = (),
+    ) -> FriendGraph:
+        """Build a graph from the students' close_friends lists plus the given snapshot files."""
+        graph = cls(students)
+        if isinstance(students, StudentTable):
+            graph.add_edges(*students.friend_edges())
+            rows, external = students.external_friend_edges()
+            nodes = np.array([graph.intern(key) for key in students.external_friends], dtype=np.int64)
+            graph.add_edges(rows, nodes[external])
+        else:
+            graph.add_close_friends(students)
+        for path in snapshots:
+            graph.add_snapshot(path)
+        return graph
+
+    @property
+    def num_nodes(self) -> int:
+        return self.size + len(self._external)
+
+    def intern(self, key: str) -> int:
+        """Node id for a student id, email or bare identifier, adding a node if it is new."""
+        row = lookup_row(self.rows_by_key, key)
+        if row is not None:
+            return row
+        key = normalize_key(key)
+        node = self._external.get(key)
+        if node is None:
+            node = self._external[key] = len(self.keys)
+            self.keys.append(key)
+        return node
+
+    def add_edges(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        """Add friendships given as node ids; direction is ignored."""
+        self._rows.append(np.asarray(rows, dtype=np.int64))
+        self._cols.append(np.asarray(cols, dtype=np.int64))
+        self._csr = None
+
+    def add_close_friends(self, students: list[Student]) -> None:
+        """Add an edge from each student (by row) to every entry of their close_friends list."""
+        rows, cols = [], []
+        for row, student in enumerate(students):
+            for friend in student.close_friends or ():
+                rows.append(row)
+                cols.append(self.intern(friend))
+        self.add_edges(np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))
+
+    def add_snapshot(self, path: Path) -> str:
+        """Load a mutual_friends_*.txt snapshot (one email per line); returns its name."""
+        with path.open("r", encoding="utf-8") as fh:
+            nodes = [self.intern(line.strip()) for line in fh if line.strip()]
+        self.snapshots[path.stem] = np.unique(np.array(nodes, dtype=np.int64))
+        self._csr = None
+        return path.stem
+
+    def adjacency(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Symmetric CSR (indptr, indices) over num_nodes, without self-loops
+        or duplicate edges; row i's friends are indices[indptr[i]:indptr[i + 1]].
+        """
+        if self._csr is None:
+            n = self.num_nodes
+            rows = np.concatenate(self._rows) if self._rows else np.empty(0, dtype=np.int64)
+            cols = np.concatenate(self._cols) if self._cols else np.empty(0, dtype=np.int64)
+            keep = rows != cols
+            keys = np.unique(np.concatenate([rows[keep] * n + cols[keep], cols[keep] * n + rows[keep]]))
+            rows, cols = np.divmod(keys, n)
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+            self._csr = (indptr, cols)
+        return self._csr
+
+    def friends(self, node: int) -> np.ndarray:
+        """Direct friends of a node."""
+        indptr, indices = self.adjacency()
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def edges(self, roster_only: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """Symmetric (rows, cols) list of direct friendships."""
+        indptr, indices = self.adjacency()
+        rows = np.repeat(np.arange(self.num_nodes), np.diff(indptr))
+        if roster_only:
+            keep = (rows < self.size) & (indices < self.size)
+            return rows[keep], indices[keep]
+        return rows, indices
+
+    def second_degree(self, roster_only: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Symmetric (rows, cols) list of friends-of-friends: pairs joined by a
+        path of length two that are not themselves friends.
+
+        This is the support of A @ A minus A and the diagonal, computed by
+        expanding each edge (i, j) into i's pairs with every friend of j in
+        one vectorized gather (sum of squared degrees entries).
+        """
+        indptr, indices = self.adjacency()
+        n = self.num_nodes
+        degree = np.diff(indptr)
+        via_rows = np.repeat(np.arange(n), degree)
+        counts = degree[indices]
+        total = int(counts.sum())
+        firsts = np.repeat(indptr[indices], counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(via_rows, counts)
+        cols = indices[firsts + offsets]
+
+        keep = rows != cols
+        if roster_only:
+            keep &= (rows < self.size) & (cols < self.size)
+        # Sort-based dedupe; rows arrive grouped, so this beats np.unique's hashing
+        keys = np.sort(rows[keep] * n + cols[keep])
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+        keys = keys[~np.isin(keys, via_rows * n + indices, assume_unique=True)]
+        return np.divmod(keys, n)
+
+    def penalize(self, cost_matrix: np.ndarray, penalty: float, second_degree: bool = True) -> np.ndarray:
+        """
+        Add penalty to the cost of friends-of-friends pairs, in place.
+
+        Use ExclusionIndex.add_edges(*graph.second_degree()) instead to forbid
+        them outright.
+
+        Returns:
+            The same cost_matrix, for chaining
+        """
+        rows, cols = self.second_degree() if second_degree else self.edges()
+        cost_matrix[rows, cols] += penalty
+        return cost_matrix
+
+    def snapshot_diff(self, old: str, new: str) -> tuple[np.ndarray, np.ndarray]:
+        """(added, removed) node ids between two snapshots."""
+        before, after = self.snapshots[old], self.snapshots[new]
+        return (
+            np.setdiff1d(after, before, assume_unique=True),
+            np.setdiff1d(before, after, assume_unique=True),
+        )
+
+    def snapshot_diffs(self) -> list[tuple[str, str, np.ndarray, np.ndarray]]:
+        """(old, new, added, removed) for every pair of consecutive snapshots, in name order."""
+        names = sorted(self.snapshots)
+        return [(old, new, *self.snapshot_diff(old, new)) for old, new in zip(names, names[1:])]
+
+
+if __name__ == "__main__":
+    import sinkhorn
+
+    table = sinkhorn.generate_mock_table(2000, seed=42, mean_friends=3.0)
+    graph = FriendGraph.build(table, snapshot_paths())
+    rows, _ = graph.edges()
+    second_rows, _ = graph.second_degree()
+    print(f"{graph.num_nodes} nodes ({graph.size} on the roster), {len(rows) // 2} friendships, "
+          f"{len(second_rows) // 2} friends-of-friends pairs")
+    for name, nodes in sorted(graph.snapshots.items()):
+        print(f"{name}: {len(nodes)} emails")
+    for old, new, added, removed in graph.snapshot_diffs():
+        print(f"{old} -> {new}: +{len(added)} -{len(removed)}")
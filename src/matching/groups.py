@@ -0,0 +1,367 @@
+"""Group (pod) matching: split the roster into size-k groups on top of the Sinkhorn plan."""
+
+from __future__ import annotations
+
+from typing import Any
+import numpy as np
+from exclusions import ExclusionIndex
+from sinkhorn import matrix_entries, plan_rows
+from student import Student, StudentTable
+
+# Smallest pod the matching program runs
+MIN_GROUP_SIZE = 3
+
+
+def _candidate_edges(
+    matrix: Any,
+    n: int,
+    top_k: int,
+    block_size: int,
+    distances: bool,
+    lambda_reg: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Symmetric (rows, cols, affinity) edge list of every student's top_k partners.
+
+    Affinities are plan probabilities, or exp(-lambda_reg * distance) when
+    matrix holds match scores. Each undirected pair keeps its larger direction.
+    """
+    k = min(top_k, n - 1)
+    keys, weights = [], []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = plan_rows(matrix, start, stop)
+        if distances:
+            block = np.exp(-lambda_reg * block)
+        block[~np.isfinite(block)] = 0.0
+        block[np.arange(stop - start), np.arange(start, stop)] = 0.0
+        cols = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        values = np.take_along_axis(block, cols, axis=1)
+        rows = np.broadcast_to(np.arange(start, stop)[:, None], cols.shape)
+        positive = values > 0
+        low = np.minimum(rows[positive], cols[positive])
+        high = np.maximum(rows[positive], cols[positive])
+        keys.append(low * n + high)
+        weights.append(values[positive])
+    if not keys:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    keys = np.concatenate(keys)
+    weights = np.concatenate(weights)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    best = np.zeros(len(unique))
+    np.maximum.at(best, inverse, weights)
+    low, high = np.divmod(unique, n)
+    return np.concatenate([low, high]), np.concatenate([high, low]), np.concatenate([best, best])
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n: int, values: np.ndarray | None = None):
+    """Sort an edge list by row and return (indptr, cols, values)."""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order], None if values is None else values[order]
+
+
+def _lookup(keys: np.ndarray, sums: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """sums[keys == query] for each query, 0 where the key is absent (keys sorted)."""
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=sums.dtype)
+    idx = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[idx] == query, sums[idx], 0)
+
+
+def _group_totals(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, group: np.ndarray, num_groups: int):
+    """Per (student, group) totals of values over edges into that group, as sorted keys and sums."""
+    member = group[cols] >= 0
+    keys = rows[member] * num_groups + group[cols[member]]
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values[member], minlength=len(unique))
+
+
+def group_sizes(num_students: int, group_size: int, min_size: int = MIN_GROUP_SIZE) -> list[int]:
+    """
+    Split num_students into ceil(n / group_size) groups whose sizes differ by
+    at most one. If those would fall below min_size, use n // min_size
+    groups instead, so the leftovers grow some groups past group_size
+    (4 students in groups of 3 make one group of 4, not two of 2). Fewer
+    than min_size students make a single group.
+    """
+    if num_students == 0:
+        return []
+    min_size = min(min_size, group_size)
+    num_groups = -(-num_students // group_size)
+    if num_students // num_groups < min_size:
+        num_groups = max(1, num_students // min_size)
+    base, extra = divmod(num_students, num_groups)
+    return [base + 1] * extra + [base] * (num_groups - extra)
+
+
+def _greedy_groups(
+    sizes: list[int],
+    order: np.ndarray,
+    n: int,
+    indptr: np.ndarray,
+    nbrs: np.ndarray,
+    weights: np.ndarray,
+    forbid_ptr: np.ndarray,
+    forbid: np.ndarray,
+) -> np.ndarray:
+    """
+    Grow each group from a seed by repeatedly adding the unassigned student
+    with the highest total affinity to its current members, skipping anyone
+    forbidden with a member. Students that fit nowhere keep group -1.
+    """
+    group = np.full(n, -1, dtype=np.intp)
+    affinity = np.zeros(n)
+    banned = np.zeros(n, dtype=bool)
+    next_seed = 0
+
+    for g, size in enumerate(sizes):
+        while next_seed < len(order) and group[order[next_seed]] >= 0:
+            next_seed += 1
+        if next_seed == len(order):
+            break
+        member = order[next_seed]
+        touched = []
+        for _ in range(size):
+            group[member] = g
+            near = nbrs[indptr[member]:indptr[member + 1]]
+            affinity[near] += weights[indptr[member]:indptr[member + 1]]
+            banned[forbid[forbid_ptr[member]:forbid_ptr[member + 1]]] = True
+            touched.append(near)
+            touched.append(forbid[forbid_ptr[member]:forbid_ptr[member + 1]])
+
+            candidates = np.concatenate(touched[::2])
+            candidates = candidates[(group[candidates] < 0) & ~banned[candidates]]
+            if len(candidates):
+                member = candidates[np.argmax(affinity[candidates])]
+                continue
+            # No open candidate edges: fall back to the next allowed student
+            rest = order[next_seed:]
+            rest = rest[(group[rest] < 0) & ~banned[rest]]
+            if not len(rest):
+                break
+            member = rest[0]
+        for indices in touched:
+            affinity[indices] = 0.0
+            banned[indices] = False
+    return group
+
+
+def _place_leftovers(
+    group: np.ndarray,
+    sizes: list[int],
+    eligible: np.ndarray,
+    forbid_ptr: np.ndarray,
+    forbid: np.ndarray,
+    min_size: int,
+) -> None:
+    """
+    Merge everyone the greedy pass left out into existing groups, in place.
+
+    Groups the greedy pass left below min_size are dissolved first (unless
+    no group reached it). Each left-out eligible student then joins a short
+    group they conflict with no one in, or else the smallest such group,
+    past its size. Only students conflicting with every group stay out.
+    """
+    counts = np.bincount(group[group >= 0], minlength=len(sizes))
+    capacity = np.asarray(sizes) - counts
+    if (counts >= min_size).any():
+        small = (counts > 0) & (counts < min_size)
+        group[(group >= 0) & small[np.maximum(group, 0)]] = -1
+        counts[small] = 0
+    # Groups the greedy pass never seeded stay empty rather than start undersized
+    alive = counts > 0
+    capacity[~alive] = 0
+    for student in np.flatnonzero(eligible & (group < 0)):
+        conflicts = group[forbid[forbid_ptr[student]:forbid_ptr[student + 1]]]
+        candidates = np.flatnonzero(alive)
+        candidates = candidates[~np.isin(candidates, conflicts)]
+        if not len(candidates):
+            continue
+        with_room = candidates[capacity[candidates] > 0]
+        g = with_room[0] if len(with_room) else candidates[np.argmin(counts[candidates])]
+        group[student] = g
+        capacity[g] -= 1
+        counts[g] += 1
+
+
+def _improve_groups(
+    group: np.ndarray,
+    num_groups: int,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    weights: np.ndarray,
+    forbid_rows: np.ndarray,
+    forbid_cols: np.ndarray,
+    max_passes: int,
+) -> int:
+    """
+    Local search over pairwise swaps between groups, in place.
+
+    Each pass recomputes per-(student, group) affinity totals, finds every
+    student i with more affinity to another group h than to its own, and
+    scores swapping i with each member j of h all at once. The best
+    non-overlapping improving swaps that keep every group free of forbidden
+    pairs are applied together.
+
+    Returns:
+        Number of passes run
+    """
+    n = len(group)
+    edge_keys = rows * n + cols
+    edge_order = np.argsort(edge_keys)
+    edge_keys, edge_weights = edge_keys[edge_order], weights[edge_order]
+    forbid_keys = np.unique(forbid_rows * n + forbid_cols)
+    forbid_ones = np.ones(len(forbid_keys))
+    students = np.arange(n)
+
+    for passes in range(1, max_passes + 1):
+        grouped = np.flatnonzero(group >= 0)
+        members = grouped[np.argsort(group[grouped], kind="stable")]
+        counts = np.bincount(group[grouped], minlength=num_groups)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        width = counts.max(initial=0)
+        slots = np.full((num_groups, width), -1, dtype=np.intp)
+        slots[group[members], np.arange(len(members)) - starts[group[members]]] = members
+
+        aff_keys, aff_sums = _group_totals(rows, cols, weights, group, num_groups)
+        own = np.where(group >= 0, _lookup(aff_keys, aff_sums, students * num_groups + group), 0.0)
+
+        # Students drawn to a group other than their own
+        i, h = np.divmod(aff_keys, num_groups)
+        drawn = (group[i] >= 0) & (group[i] != h) & (aff_sums > own[i])
+        if not drawn.any():
+            return passes
+        move_gain = aff_sums[drawn] - own[i[drawn]]
+        i = np.repeat(i[drawn], width)
+        move_gain = np.repeat(move_gain, width)
+        j = slots[h[drawn]].ravel()
+        valid = j >= 0
+        i, j, move_gain = i[valid], j[valid], move_gain[valid]
+        g_i, g_j = group[i], group[j]
+
+        ban_keys, ban_sums = _group_totals(forbid_rows, forbid_cols, np.ones(len(forbid_rows)), group, num_groups)
+        w_ij = _lookup(edge_keys, edge_weights, i * n + j)
+        f_ij = _lookup(forbid_keys, forbid_ones, i * n + j)
+        gain = move_gain + _lookup(aff_keys, aff_sums, j * num_groups + g_i) - own[j] - 2 * w_ij
+        feasible = (
+            (_lookup(ban_keys, ban_sums, i * num_groups + g_j) - f_ij == 0)
+            & (_lookup(ban_keys, ban_sums, j * num_groups + g_i) - f_ij == 0)
+        )
+        improving = np.flatnonzero(feasible & (gain > 1e-12))
+        if not len(improving):
+            return passes
+
+        # Apply the best swaps whose groups no earlier swap in this pass touched
+        improving = improving[np.argsort(-gain[improving], kind="stable")]
+        touched = np.zeros(num_groups, dtype=bool)
+        for k in improving.tolist():
+            a, b = g_i[k], g_j[k]
+            if touched[a] or touched[b]:
+                continue
+            touched[a] = touched[b] = True
+            group[i[k]], group[j[k]] = b, a
+    return max_passes
+
+
+def form_groups(
+    matrix: Any,
+    students: list[Student] | StudentTable,
+    group_size: int = 4,
+    exclusions: ExclusionIndex | None = None,
+    distances: bool = False,
+    lambda_reg: float = 1.0,
+    top_k: int = 32,
+    max_passes: int = 50,
+    block_size: int = 1024,
+    seed: int = 0,
+    min_group_size: int = MIN_GROUP_SIZE,
+) -> list[dict]:
+    """
+    Partition students into groups of about group_size with high mutual affinity.
+
+    Pairs are weighted by their Sinkhorn matching probability, and only each
+    student's top_k partners are considered. Groups are grown greedily from
+    seeds, with students that have the most exclusions seeded first. They
+    are then improved by vectorized swap local search (see _improve_groups)
+    that maximizes the total within-group affinity.
+
+    No group ever contains a forbidden pair, and no group is smaller than
+    min_group_size (unless the whole roster is): students who do not fit a
+    group with room are merged into the smallest group they can join.
+    Students the index blocks entirely, or who conflict with every group,
+    are left out.
+
+    Args:
+        matrix: Dense, sparse or lazy Sinkhorn plan, or a score matrix when
+            distances is set
+        students: List of students (or a StudentTable) in the matrix order
+        group_size: Target group size; the roster is split as in group_sizes
+        exclusions: Prebuilt ExclusionIndex; defaults to one built from the
+            students' close_friends lists
+        distances: matrix holds match_score distances; pairs are then
+            weighted by the kernel exp(-lambda_reg * distance)
+        lambda_reg: Kernel sharpness for distances
+        top_k: Candidate partners kept per student
+        max_passes: Cap on local-search passes
+        block_size: Rows of matrix read at a time
+        seed: Seed for the order in which groups are seeded
+        min_group_size: Smallest allowed group (capped at group_size)
+
+    Returns:
+        One record per group with member_ids, member_names, size and
+        compatibility_score (mean pairwise affinity within the group), best
+        groups first
+    """
+    if group_size < 2:
+        raise ValueError("group_size must be at least 2")
+    n = len(students)
+    if exclusions is None:
+        exclusions = ExclusionIndex.from_students(students)
+    eligible = ~exclusions.blocked
+    forbid_rows, forbid_cols = exclusions.edges()
+    keep = forbid_rows != forbid_cols
+    forbid_rows, forbid_cols = forbid_rows[keep], forbid_cols[keep]
+
+    rows, cols, weights = _candidate_edges(matrix, n, top_k, block_size, distances, lambda_reg) if n > 1 else (
+        np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    )
+    # Forbidden and blocked pairs never count towards a group's affinity
+    allowed = eligible[rows] & eligible[cols]
+    allowed &= ~np.isin(rows * n + cols, forbid_rows * n + forbid_cols)
+    rows, cols, weights = rows[allowed], cols[allowed], weights[allowed]
+
+    indptr, nbrs, nbr_weights = _csr(rows, cols, n, weights)
+    forbid_ptr, forbid, _ = _csr(forbid_rows, forbid_cols, n)
+
+    min_group_size = min(min_group_size, group_size)
+    sizes = group_sizes(int(eligible.sum()), group_size, min_group_size)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(np.flatnonzero(eligible))
+    order = order[np.argsort(-np.diff(forbid_ptr)[order], kind="stable")]
+
+    group = _greedy_groups(sizes, order, n, indptr, nbrs, nbr_weights, forbid_ptr, forbid)
+    _place_leftovers(group, sizes, eligible, forbid_ptr, forbid, min_group_size)
+    _improve_groups(group, len(sizes), rows, cols, weights, forbid_rows, forbid_cols, max_passes)
+
+    grouped = np.flatnonzero(group >= 0)
+    members = grouped[np.argsort(group[grouped], kind="stable")]
+    bounds = np.cumsum(np.bincount(group[grouped], minlength=len(sizes)))[:-1]
+    records = []
+    for rows_in_group in np.split(members, bounds):
+        if not len(rows_in_group):
+            continue
+        a, b = np.triu_indices(len(rows_in_group), k=1)
+        affinity = matrix_entries(matrix, rows_in_group[a], rows_in_group[b]) if len(a) else np.zeros(0)
+        if distances:
+            affinity = np.exp(-lambda_reg * affinity)
+        people = [students[r] for r in rows_in_group.tolist()]
+        records.append({
+            "member_ids": [person.id for person in people],
+            "member_names": [person.first_name or person.id for person in people],
+            "size": len(rows_in_group),
+            "compatibility_score": float(affinity.mean()) if len(affinity) else 0.0,
+        })
+    records.sort(key=lambda g: g["compatibility_score"], reverse=True)
+    return records
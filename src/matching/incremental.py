@@ -0,0 +1,187 @@
+"""Incremental re-matching as students sign up, update their survey or leave."""
+
+from __future__ import annotations
+
+from typing import Dict
+import numpy as np
+from exclusions import ExclusionIndex
+from sinkhorn import DEFAULT_WEIGHTS, SinkhornPlan, score_matrix, score_rows, sinkhorn_scalings
+from student import Student, lookup_row, normalize_key, row_lookup
+
+
+class IncrementalMatcher:
+    """
+    Keeps scores, kernel and Sinkhorn scalings current across roster changes.
+
+    A change to one student only recomputes that student's score/kernel row
+    and column (scores are symmetric), then resumes Sinkhorn from the previous
+    u/v, which converges in a few iterations instead of a full rebuild. This
+    is what a signup hook (e.g. after POST /api/signups) should call rather
+    than rerunning the whole pipeline.
+
+    Matrices are stored in buffers with spare capacity so that adding a
+    student does not reallocate the n x n arrays every time. close_friends
+    entries resolve through the same id/email/handle lookup as
+    ExclusionIndex, so a refreshed row forbids exactly the pairs a rebuild
+    would.
+    """
+
+    def __init__(
+        self,
+        students: list[Student],
+        lambda_reg: float = 1.0,
+        weights: Dict[str, float] | None = None,
+        max_iterations: int = 1000,
+        tolerance: float = 1e-6,
+        check_every: int = 10,
+    ):
+        self.students = list(students)
+        self.lambda_reg = lambda_reg
+        self.weights = DEFAULT_WEIGHTS if weights is None else weights
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.rows_by_id = {student.id: row for row, student in enumerate(self.students)}
+        if len(self.rows_by_id) != len(self.students):
+            raise ValueError("Student ids must be unique")
+        self._index_keys()
+
+        n = len(self.students)
+        self._scores = score_matrix(self.students, self.weights)
+        cost_matrix = ExclusionIndex.from_students(self.students).apply(self._scores.copy())
+        self._kernel = np.exp(-lambda_reg * cost_matrix)
+        self._u = np.ones(n)
+        self._v = np.ones(n)
+        self.iterations = 0
+        self.solve()
+
+    def __len__(self) -> int:
+        return len(self.students)
+
+    @property
+    def scores(self) -> np.ndarray:
+        n = len(self.students)
+        return self._scores[:n, :n]
+
+    @property
+    def kernel(self) -> np.ndarray:
+        n = len(self.students)
+        return self._kernel[:n, :n]
+
+    @property
+    def u(self) -> np.ndarray:
+        return self._u[:len(self.students)]
+
+    @property
+    def v(self) -> np.ndarray:
+        return self._v[:len(self.students)]
+
+    def plan(self) -> SinkhornPlan:
+        """Lazy view of the current matching probabilities."""
+        return SinkhornPlan(self.kernel, self.u, self.v)
+
+    def solve(self) -> int:
+        """Resume Sinkhorn from the current scalings; returns the iterations used."""
+        u, v, self.iterations = sinkhorn_scalings(
+            self.kernel, self.u, self.v,
+            self.max_iterations, self.tolerance, self.check_every,
+        )
+        n = len(self.students)
+        self._u[:n] = u
+        self._v[:n] = v
+        return self.iterations
+
+    def _ensure_capacity(self, n: int) -> None:
+        capacity = self._scores.shape[0]
+        if n <= capacity:
+            return
+        new_capacity = max(2 * capacity, n, 16)
+        size = len(self.students)
+        for name in ("_scores", "_kernel"):
+            grown = np.zeros((new_capacity, new_capacity))
+            grown[:size, :size] = getattr(self, name)[:size, :size]
+            setattr(self, name, grown)
+        for name in ("_u", "_v"):
+            grown = np.ones(new_capacity)
+            grown[:size] = getattr(self, name)[:size]
+            setattr(self, name, grown)
+
+    def _index_keys(self) -> None:
+        """Rebuild rows_by_key, the id/email/handle lookup used to resolve close_friends."""
+        self.rows_by_key = row_lookup([s.id for s in self.students], [s.email for s in self.students])
+
+    def _refresh(self, row: int) -> None:
+        """Recompute the score and kernel row/column of one student."""
+        student = self.students[row]
+        n = len(self.students)
+        scores_row = score_rows(self.students, row, row + 1, self.weights)[0]
+        forbidden = np.zeros(n, dtype=bool)
+        forbidden[row] = True
+        for entry in student.close_friends or ():
+            friend = lookup_row(self.rows_by_key, entry)
+            if friend is not None:
+                forbidden[friend] = True
+        # Students listing this one by id, email or bare handle
+        for col, other in enumerate(self.students):
+            if any(lookup_row(self.rows_by_key, entry) == row for entry in other.close_friends or ()):
+                forbidden[col] = True
+
+        kernel_row = np.exp(-self.lambda_reg * scores_row)
+        kernel_row[forbidden] = 0.0
+        self._scores[row, :n] = scores_row
+        self._scores[:n, row] = scores_row
+        self._kernel[row, :n] = kernel_row
+        self._kernel[:n, row] = kernel_row
+
+    def add_student(self, student: Student, solve: bool = True) -> int:
+        """Add a new student and re-match; returns their row index."""
+        if student.id in self.rows_by_id:
+            raise ValueError(f"Student already present: {student.id}")
+        row = len(self.students)
+        self._ensure_capacity(row + 1)
+        self.students.append(student)
+        self.rows_by_id[student.id] = row
+        # Same precedence as row_lookup: emails never shadow an id
+        if student.email:
+            self.rows_by_key.setdefault(normalize_key(student.email), row)
+        self.rows_by_key[student.id] = row
+        self._u[row] = 1.0
+        self._v[row] = 1.0
+        self._refresh(row)
+        if solve:
+            self.solve()
+        return row
+
+    def update_student(self, student: Student, solve: bool = True) -> int:
+        """Replace the student with the same id (e.g. after a survey edit) and re-match."""
+        row = self.rows_by_id.get(student.id)
+        if row is None:
+            raise KeyError(f"Unknown student: {student.id}")
+        if student.email != self.students[row].email:
+            self.students[row] = student
+            self._index_keys()
+        else:
+            self.students[row] = student
+        self._refresh(row)
+        if solve:
+            self.solve()
+        return row
+
+    def remove_student(self, student_id: str, solve: bool = True) -> None:
+        """Remove a student and re-match; the last row is moved into the freed slot."""
+        row = self.rows_by_id.pop(student_id, None)
+        if row is None:
+            raise KeyError(f"Unknown student: {student_id}")
+        last = len(self.students) - 1
+        if row != last:
+            for matrix in (self._scores, self._kernel):
+                matrix[row, :last + 1] = matrix[last, :last + 1]
+                matrix[:last + 1, row] = matrix[:last + 1, last]
+            self._u[row] = self._u[last]
+            self._v[row] = self._v[last]
+            self.students[row] = self.students[last]
+            self.rows_by_id[self.students[row].id] = row
+        self.students.pop()
+        self._index_keys()
+        if solve:
+            self.solve()
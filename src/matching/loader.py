@@ -2,35 +2,162 @@
 
 from __future__ import annotations
 
+import hashlib
+import io
 import json
+import os
 from pathlib import Path
-from typing import Any, Dict
-from student import Student
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, Mapping, TextIO
+import numpy as np
+import sinkhorn
+from student import Student, StudentTable
+
+if TYPE_CHECKING:
+    from roster import RosterIndex
 
 DATA_FILE = Path(__file__).parent / "data" / "local_dataset.json"
 MOCK_DATASET_FILE = Path(__file__).parent / "data" / "mock_dataset.json"
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+CACHE_VERSION = 2
 
 def load_local_dataset(path: Path = DATA_FILE) -> Dict[str, Any]:
     """Load the locally cached dataset produced by dataAccess.ts."""
     with path.open("r", encoding="utf-8") as fh:
         return json.load(fh)
 
-def save_local_dataset(dataset: Dict[str, Any], path: Path = DATA_FILE) -> None:
-    """Save a dataset to the local JSON file."""
-    with path.open("w", encoding="utf-8") as fh:
+def _dump_dataset(dataset: Dict[str, Any], fh: TextIO, compact: bool) -> None:
+    if compact:
+        json.dump(dataset, fh, separators=(",", ":"), ensure_ascii=False)
+    else:
         json.dump(dataset, fh, indent=2, ensure_ascii=False)
 
-def save_mock_dataset(dataset: Dict[str, Any], path: Path = MOCK_DATASET_FILE) -> None:
+def save_local_dataset(dataset: Dict[str, Any], path: Path = DATA_FILE, compact: bool = False) -> None:
+    """Save a dataset to the local JSON file (without indentation if compact)."""
+    with path.open("w", encoding="utf-8") as fh:
+        _dump_dataset(dataset, fh, compact)
+
+def save_mock_dataset(dataset: Dict[str, Any], path: Path = MOCK_DATASET_FILE, compact: bool = False) -> bool:
     """
-    Save a mock dataset to a JSON file.
+    Save a mock dataset to a JSON file, unless the file already holds it.
+    
+    Leaving an identical file untouched keeps its mtime, so the table and
+    score caches next to it stay valid without rehashing.
     
     Args:
         dataset: Dictionary with 'students' and 'matches' keys
         path: Path to save the mock dataset (defaults to data/mock_dataset.json)
+        compact: Write without indentation or spaces, roughly halving the file size
+    
+    Returns:
+        True if the file was written, False if it was already up to date
     """
+    buffer = io.StringIO()
+    _dump_dataset(dataset, buffer, compact)
+    content = buffer.getvalue()
+    if path.exists() and path.stat().st_size == len(content.encode("utf-8")) and path.read_text(encoding="utf-8") == content:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    return True
+
+def save_students_ndjson(students: Iterable[Dict[str, Any]], path: Path) -> None:
+    """Write student records as NDJSON, one compact JSON object per line."""
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", encoding="utf-8") as fh:
-        json.dump(dataset, fh, indent=2, ensure_ascii=False)
+        for student in students:
+            fh.write(json.dumps(student, separators=(",", ":"), ensure_ascii=False))
+            fh.write("\n")
+
+class _JsonStream:
+    """Buffered reader that decodes one JSON value at a time from a text file."""
+
+    def __init__(self, fh: TextIO, chunk_size: int):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self, size: int) -> bool:
+        chunk = self.fh.read(size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def skip(self, char: str) -> None:
+        """Consume char if it is next."""
+        if self.peek() == char:
+            self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value, reading more of the file as needed."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number ending exactly at the buffer end may continue in the file
+            if end == len(self.buffer) and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+def iter_students(path: Path = DATA_FILE, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Yield student records one at a time without loading the whole file.
+    
+    Args:
+        path: A dataset JSON file (the top-level 'students' array is streamed,
+            other keys are skipped) or an NDJSON file of student records
+        chunk_size: Number of characters read from the file at a time
+    
+    Yields:
+        Student record dictionaries, in file order
+    """
+    with path.open("r", encoding="utf-8") as fh:
+        if path.suffix in NDJSON_SUFFIXES:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        stream = _JsonStream(fh, chunk_size)
+        stream.expect("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key == "students":
+                stream.expect("[")
+                while stream.peek() != "]":
+                    yield stream.value()
+                    stream.skip(",")
+                stream.expect("]")
+            else:
+                stream.value()
+            stream.skip(",")
 
 def load_mock_dataset(path: Path = MOCK_DATASET_FILE) -> Dict[str, Any]:
     """
@@ -66,4 +193,164 @@ def parse_student(student: Dict[str, Any]) -> Student:
         survey_completed=student["survey_completed"],
     )
 
-    
\ No newline at end of file
+def _normalized_students(records: Iterable[Dict[str, Any]], roster: RosterIndex) -> Iterator[Student]:
+    for record in records:
+        student = parse_student(record)
+        student.close_friends = roster.normalize_friends(student.close_friends)
+        yield student
+
+def build_student_table(records: Iterable[Dict[str, Any]], roster: RosterIndex | None = None) -> StudentTable:
+    """
+    Build a columnar StudentTable straight from dataset student records.
+
+    Each record goes through parse_student and is discarded once its fields
+    are appended, so no per-student objects are kept. With a roster index,
+    close_friends entries (handles or typed names) are first mapped to
+    roster emails so they resolve to the matching students' rows.
+    """
+    if roster is not None:
+        return StudentTable.from_students(_normalized_students(records, roster))
+    return StudentTable.from_students(parse_student(record) for record in records)
+
+def load_student_table(path: Path = DATA_FILE, roster: RosterIndex | None = None) -> StudentTable:
+    """Stream a dataset (JSON or NDJSON) straight into a StudentTable."""
+    return build_student_table(iter_students(path), roster)
+
+def _file_sha1(path: Path) -> str:
+    digest = hashlib.sha1()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _table_cache_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}.cache.npz")
+
+def scores_cache_path(path: Path, source_sha1: str, weights: Dict[str, float] | None = None, dtype: Any = np.float64) -> Path:
+    """Where the score matrix of a dataset with this content hash, weights and dtype is cached."""
+    suffix = "" if np.dtype(dtype) == np.float64 else f"-{np.dtype(dtype).name}"
+    return path.with_name(f"{path.stem}.scores-{source_sha1[:12]}-{sinkhorn.weights_key(weights)}{suffix}.npy")
+
+def _atomic_write(path: Path, write) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as fh:
+        write(fh)
+    os.replace(tmp_path, path)
+
+_CACHE_META = ("cache_version", "cache_key", "source_size", "source_mtime_ns", "source_sha1")
+
+def cached_npz(
+    path: Path,
+    cache_path: Path,
+    version: int,
+    build: Callable[[], Any],
+    load: Callable[[Mapping[str, np.ndarray]], Any],
+    key: str = "",
+) -> tuple[Any, str]:
+    """
+    Build an object from a source file through a binary .npz sidecar cache.
+    
+    The sidecar is reused while its version, key and the source's size and
+    mtime match; if only the mtime changed, the content hash decides.
+    Otherwise build() is called and its to_arrays() output, stamped with the
+    version, key and the source's size, mtime and hash, is written atomically.
+    
+    Args:
+        path: Source file the object is derived from
+        cache_path: Sidecar .npz file
+        version: Format version; sidecars of other versions are rebuilt
+        build: Builds the object from the source; the result must have to_arrays()
+        load: Rebuilds the object from the sidecar's arrays
+        key: Identifies any other input build() depends on (e.g. a roster);
+            sidecars built with another key are rebuilt
+    
+    Returns:
+        (object, sha1 of the source file)
+    """
+    stat = path.stat()
+    if cache_path.exists():
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if all(key in cached.files for key in _CACHE_META):
+                meta = {key: cached[key].item() for key in _CACHE_META}
+                if meta["cache_version"] == version and meta["cache_key"] == key and meta["source_size"] == stat.st_size:
+                    if meta["source_mtime_ns"] == stat.st_mtime_ns or meta["source_sha1"] == _file_sha1(path):
+                        return load(cached), meta["source_sha1"]
+
+    source_sha1 = _file_sha1(path)
+    value = build()
+    arrays = value.to_arrays()
+    arrays.update(
+        cache_version=np.array(version),
+        cache_key=np.array(key),
+        source_size=np.array(stat.st_size),
+        source_mtime_ns=np.array(stat.st_mtime_ns),
+        source_sha1=np.array(source_sha1),
+    )
+    _atomic_write(cache_path, lambda fh: np.savez(fh, **arrays))
+    return value, source_sha1
+
+def load_table_cached(path: Path = DATA_FILE, roster: RosterIndex | None = None) -> tuple[StudentTable, str]:
+    """
+    Load a dataset's StudentTable through a <stem>.cache.npz sidecar cache
+    (see cached_npz).
+    
+    With a roster index (from roster.load_roster_index), survey-entered
+    friend names are resolved to roster emails, and the sidecar is keyed by
+    the roster's INDEX_VERSION and CSV sha1 as well, so it is rebuilt when
+    the roster changes.
+    
+    Returns:
+        (table, sha1 of the dataset file)
+    """
+    key = "" if roster is None else roster.cache_key
+    return cached_npz(
+        path, _table_cache_path(path), CACHE_VERSION,
+        lambda: load_student_table(path, roster), StudentTable.from_arrays, key,
+    )
+
+def save_scores_cache(path: Path, source_sha1: str, scores: np.ndarray, weights: Dict[str, float] | None = None) -> Path:
+    """
+    Write a score matrix to its cache file next to the dataset.
+
+    Score caches of older versions of the dataset are removed first.
+
+    Returns:
+        The cache file path
+    """
+    scores_path = scores_cache_path(path, source_sha1, weights, scores.dtype)
+    for stale in path.parent.glob(f"{path.stem}.scores-*.npy"):
+        if not stale.name.startswith(f"{path.stem}.scores-{source_sha1[:12]}-"):
+            stale.unlink()
+    _atomic_write(scores_path, lambda fh: np.save(fh, scores))
+    return scores_path
+
+def load_dataset_cached(
+    path: Path = DATA_FILE,
+    weights: Dict[str, float] | None = None,
+    workers: int = 1,
+    dtype: Any = np.float64,
+) -> tuple[StudentTable, np.ndarray]:
+    """
+    Load a dataset's StudentTable and score matrix, reusing cached copies when valid.
+    
+    The score matrix is cached as <stem>.scores-<source hash>-<weights key>.npy
+    (with a -float32 suffix for float32 scores)
+    and returned memory-mapped read-only, so repeat runs on an unchanged
+    dataset with the same scoring weights skip parsing and scoring entirely.
+    Score caches of older versions of the dataset are removed.
+    
+    Args:
+        path: Dataset JSON or NDJSON file
+        weights: Scoring weights (defaults to sinkhorn.DEFAULT_WEIGHTS)
+        workers: Processes used to compute the score matrix on a cache miss
+        dtype: dtype of the score matrix (np.float32 halves its size)
+    
+    Returns:
+        (table, scores)
+    """
+    table, source_sha1 = load_table_cached(path)
+    scores_path = scores_cache_path(path, source_sha1, weights, dtype)
+    if not scores_path.exists():
+        scores = sinkhorn.score_matrix(table, weights, workers=workers, dtype=dtype)
+        save_scores_cache(path, source_sha1, scores, weights)
+    return table, np.load(scores_path, mmap_mode="r")
@@ -0,0 +1,56 @@
+"""Pluggable timing and metrics hooks for the matching pipeline."""
+
+from __future__ import annotations
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class PipelineMetrics:
+    """
+    Collects per-stage wall time, peak traced allocations and Sinkhorn convergence.
+
+    Memory tracing is opt-in: tracemalloc hooks every allocation, which
+    inflates the timings of Python-heavy stages, so leave trace_memory off
+    when the seconds matter.
+
+    Pipeline code wraps each stage in `with metrics.stage(name):` and passes
+    `metrics.sinkhorn_iteration` to sinkhorn_matching as its callback. Subclass
+    and override these two methods to forward metrics elsewhere.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.sinkhorn_errors: list[tuple[int, float]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and, if enabled, its tracemalloc peak."""
+        owns_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {"seconds": time.perf_counter() - start}
+            if self.trace_memory:
+                record["peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if owns_tracing:
+                tracemalloc.stop()
+            self.stages[name] = record
+
+    def sinkhorn_iteration(self, iteration: int, marginal_error: float) -> None:
+        """Record the row marginal error reported at a Sinkhorn convergence check."""
+        self.sinkhorn_errors.append((iteration, marginal_error))
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage records plus the total wall time."""
+        timings = {name: dict(record) for name, record in self.stages.items()}
+        timings["total"] = {"seconds": sum(record["seconds"] for record in self.stages.values())}
+        return timings
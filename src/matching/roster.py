@@ -0,0 +1,206 @@
+"""Lookup index over the undergraduate roster for resolving survey-entered friends."""
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Iterable, Mapping
+import numpy as np
+from loader import cached_npz
+
+ROSTER_FILE = Path(__file__).parents[1] / "data" / "stanford_undergraduates.csv"
+INDEX_VERSION = 2
+# Minimum trigram (Dice) similarity for a fuzzy name match
+MIN_SIMILARITY = 0.6
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _trigrams(name: str) -> set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RosterIndex:
+    """
+    Exact and fuzzy lookup of roster students by email, handle or name.
+
+    Emails and handles (the part before @, which dataAccess.ts stores in
+    close_friends) resolve through a hash map, as do unambiguous
+    "first last" and "first middle last" names. Other names go through a
+    trigram index: a CSR mapping each trigram to the rows whose name
+    contains it, so a query only touches rows sharing a trigram with it.
+
+    Rows are the CSV rows that have an email, deduplicated by email.
+    """
+
+    def __init__(
+        self,
+        first_names: list[str],
+        middle_names: list[str],
+        last_names: list[str],
+        emails: list[str],
+        trigram_vocab: list[str],
+        trigram_indptr: np.ndarray,
+        trigram_indices: np.ndarray,
+        trigram_counts: np.ndarray,
+    ):
+        self.first_names = first_names
+        self.middle_names = middle_names
+        self.last_names = last_names
+        self.emails = emails
+        self.trigram_ids = {trigram: k for k, trigram in enumerate(trigram_vocab)}
+        self.trigram_indptr = trigram_indptr
+        self.trigram_indices = trigram_indices
+        self.trigram_counts = trigram_counts
+
+        self.rows_by_key: dict[str, int] = {}
+        ambiguous = set()
+        for row, (first, middle, last, email) in enumerate(zip(first_names, middle_names, last_names, emails)):
+            self.rows_by_key[email] = row
+            self.rows_by_key[email.split("@")[0]] = row
+            for name in {_normalize_name(f"{first} {last}"), _normalize_name(f"{first} {middle} {last}")}:
+                if self.rows_by_key.setdefault(name, row) != row:
+                    ambiguous.add(name)
+        for name in ambiguous:
+            del self.rows_by_key[name]
+        self._resolved: dict[str, str | None] = {}
+        # sha1 of the CSV, set by load_roster_index
+        self.source_sha1: str | None = None
+
+    @classmethod
+    def from_csv(cls, path: Path = ROSTER_FILE) -> RosterIndex:
+        """Parse the roster CSV (first_name, middle_name, last_name, email) and build the trigram index."""
+        first_names, middle_names, last_names, emails = [], [], [], []
+        seen = set()
+        with path.open("r", encoding="utf-8", newline="") as fh:
+            for record in csv.DictReader(fh):
+                email = (record.get("email") or "").strip().lower()
+                if not email or email in seen:
+                    continue
+                seen.add(email)
+                first_names.append((record.get("first_name") or "").strip())
+                middle_names.append((record.get("middle_name") or "").strip())
+                last_names.append((record.get("last_name") or "").strip())
+                emails.append(email)
+
+        vocab: dict[str, int] = {}
+        rows, trigram_ids, counts = [], [], []
+        for row, (first, last) in enumerate(zip(first_names, last_names)):
+            trigrams = _trigrams(_normalize_name(f"{first} {last}"))
+            counts.append(len(trigrams))
+            for trigram in trigrams:
+                trigram_ids.append(vocab.setdefault(trigram, len(vocab)))
+                rows.append(row)
+        trigram_ids = np.array(trigram_ids, dtype=np.int64)
+        order = np.argsort(trigram_ids, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(trigram_ids, minlength=len(vocab)), out=indptr[1:])
+        return cls(
+            first_names, middle_names, last_names, emails,
+            trigram_vocab=list(vocab),
+            trigram_indptr=indptr,
+            trigram_indices=np.array(rows, dtype=np.int32)[order],
+            trigram_counts=np.array(counts, dtype=np.int32),
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Flatten the index into plain NumPy arrays, e.g. for np.savez."""
+        return {
+            "first_names": np.array(self.first_names, dtype=str),
+            "middle_names": np.array(self.middle_names, dtype=str),
+            "last_names": np.array(self.last_names, dtype=str),
+            "emails": np.array(self.emails, dtype=str),
+            "trigram_vocab": np.array(list(self.trigram_ids), dtype=str),
+            "trigram_indptr": self.trigram_indptr,
+            "trigram_indices": self.trigram_indices,
+            "trigram_counts": self.trigram_counts,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> RosterIndex:
+        """Rebuild an index from the output of to_arrays."""
+        return cls(
+            first_names=arrays["first_names"].tolist(),
+            middle_names=arrays["middle_names"].tolist(),
+            last_names=arrays["last_names"].tolist(),
+            emails=arrays["emails"].tolist(),
+            trigram_vocab=arrays["trigram_vocab"].tolist(),
+            trigram_indptr=np.asarray(arrays["trigram_indptr"]),
+            trigram_indices=np.asarray(arrays["trigram_indices"]),
+            trigram_counts=np.asarray(arrays["trigram_counts"]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.emails)
+
+    @property
+    def cache_key(self) -> str:
+        """Key of caches built through this index: INDEX_VERSION and the roster CSV's sha1."""
+        if self.source_sha1 is None:
+            raise ValueError("roster index has no source sha1; load it with load_roster_index")
+        return f"roster-{INDEX_VERSION}-{self.source_sha1}"
+
+    def lookup(self, key: str) -> int | None:
+        """Row of an exact email, handle or unambiguous full name, else None."""
+        key = key.strip().lower()
+        row = self.rows_by_key.get(key)
+        return self.rows_by_key.get(_normalize_name(key)) if row is None else row
+
+    def search(self, name: str, limit: int = 5) -> list[tuple[int, float]]:
+        """
+        Rows whose "first last" name is most similar to name by trigram Dice
+        similarity, as (row, similarity) pairs, best first.
+        """
+        trigrams = _trigrams(_normalize_name(name))
+        query = [self.trigram_ids[t] for t in trigrams if t in self.trigram_ids]
+        if not query:
+            return []
+        postings = np.concatenate([
+            self.trigram_indices[self.trigram_indptr[k]:self.trigram_indptr[k + 1]] for k in query
+        ])
+        rows, shared = np.unique(postings, return_counts=True)
+        similarity = 2.0 * shared / (len(trigrams) + self.trigram_counts[rows])
+        best = np.argsort(-similarity, kind="stable")[:limit]
+        return list(zip(rows[best].tolist(), similarity[best].tolist()))
+
+    def resolve(self, entry: str, min_similarity: float = MIN_SIMILARITY) -> str | None:
+        """
+        Email for a close_friends entry (email, handle or name), or None.
+
+        Names (entries with a space) without an exact match take the most similar roster name when
+        its similarity reaches min_similarity and no other name ties it.
+        Results are memoized per entry.
+        """
+        if entry in self._resolved:
+            return self._resolved[entry]
+        row = self.lookup(entry)
+        if row is None and " " in entry.strip():
+            matches = self.search(entry, limit=2)
+            if matches and matches[0][1] >= min_similarity and (len(matches) == 1 or matches[1][1] < matches[0][1]):
+                row = matches[0][0]
+        email = None if row is None else self.emails[row]
+        self._resolved[entry] = email
+        return email
+
+    def normalize_friends(self, entries: Iterable[str] | None) -> list[str] | None:
+        """Map close_friends entries to roster emails, keeping entries that do not resolve."""
+        if not entries:
+            return entries
+        return [self.resolve(entry) or entry for entry in entries]
+
+
+def _index_cache_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}.index.npz")
+
+
+def load_roster_index(path: Path = ROSTER_FILE) -> RosterIndex:
+    """
+    Load the roster index through a <stem>.index.npz sidecar cache (see
+    loader.cached_npz), re-parsing the CSV when it changes.
+    """
+    index, source_sha1 = cached_npz(path, _index_cache_path(path), INDEX_VERSION, lambda: RosterIndex.from_csv(path), RosterIndex.from_arrays)
+    index.source_sha1 = source_sha1
+    return index
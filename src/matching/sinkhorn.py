@@ -2,119 +2,507 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
-import random
-from datetime import datetime, timezone
-from typing import Any, Dict
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Callable, Dict
 import numpy as np
-from student import Student
+from exclusions import ExclusionIndex
+from student import CATEGORICAL_FIELDS, Student, StudentTable
 
 
-def match_score(student_a: Student, student_b: Student) -> float:
+# Weight of each distance term in match_score / score_matrix. Every
+# categorical term contributes its full weight on a mismatch, interests
+# contribute weight * (1 - Jaccard similarity) and grad_year contributes
+# weight * |year difference|.
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "major": 1.0,
+    "dorm": 1.0,
+    "sex": 0.5,
+    "interests": 2.0,
+    "grad_year": 0.25,
+}
+
+# Bump whenever match_score / score_matrix change what they compute, so
+# cached score matrices built by an older formula are not reused.
+SCORING_VERSION = 1
+
+
+def weights_key(weights: Dict[str, float] | None = None) -> str:
+    """Short stable key identifying the scoring formula version and weights."""
+    w = DEFAULT_WEIGHTS if weights is None else weights
+    payload = json.dumps({"version": SCORING_VERSION, "weights": w}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _same(value_a: Any, value_b: Any) -> float:
+    """Return 1.0 if both values are known and equal, 0.0 otherwise."""
+    return 1.0 if value_a is not None and value_a == value_b else 0.0
+
+
+def match_score(
+    student_a: Student,
+    student_b: Student,
+    weights: Dict[str, float] | None = None,
+) -> float:
     """Calculate match score between two students (lower is better)."""
-    return 0.0
+    w = DEFAULT_WEIGHTS if weights is None else weights
+
+    score = 0.0
+    score += w["major"] * (1.0 - _same(student_a.major, student_b.major))
+    score += w["dorm"] * (1.0 - _same(student_a.dorm, student_b.dorm))
+    score += w["sex"] * (1.0 - _same(student_a.sex, student_b.sex))
+
+    interests_a = set(student_a.interests or ())
+    interests_b = set(student_b.interests or ())
+    union = len(interests_a | interests_b)
+    jaccard = len(interests_a & interests_b) / union if union else 0.0
+    score += w["interests"] * (1.0 - jaccard)
+
+    if student_a.grad_year is not None and student_b.grad_year is not None:
+        gap = float(abs(student_a.grad_year - student_b.grad_year))
+    else:
+        gap = 0.0
+    score += w["grad_year"] * gap
+
+    return score
+
+
+def encode_features(students: list[Student] | StudentTable) -> Dict[str, np.ndarray]:
+    """
+    Encode students once into the numeric arrays used by score_matrix.
+
+    Args:
+        students: Students (or a StudentTable) in the order of the rows of the score matrix
+
+    Returns:
+        Dictionary with a one-hot matrix per categorical field, a multi-hot
+        'interests' matrix, its row sums 'interest_counts', and 'grad_year'
+        as floats with NaN for unknown years
+    """
+    table = students if isinstance(students, StudentTable) else StudentTable.from_students(students)
+    n = len(table)
+    features = {}
+    for field in CATEGORICAL_FIELDS:
+        codes = table.codes[field]
+        known = np.flatnonzero(codes >= 0)
+        encoded = np.zeros((n, len(table.categories[field])))
+        encoded[known, codes[known]] = 1.0
+        features[field] = encoded
+
+    interests = np.zeros((n, len(table.interest_vocab)))
+    rows = np.repeat(np.arange(n), np.diff(table.interest_indptr))
+    interests[rows, table.interest_indices] = 1.0
+    features["interests"] = interests
+    features["interest_counts"] = interests.sum(axis=1)
+    features["grad_year"] = table.grad_year
+    return features
+
+
+def _score_rows(
+    features: Dict[str, np.ndarray],
+    start: int,
+    stop: int,
+    weights: Dict[str, float],
+) -> np.ndarray:
+    """
+    Compute rows [start, stop) of the score matrix.
+
+    Terms are accumulated in the same order and with the same float64
+    operations as match_score, so every entry equals the per-pair result.
+    """
+    block = slice(start, stop)
+    scores = np.zeros((stop - start, len(features["grad_year"])))
+    for field in CATEGORICAL_FIELDS:
+        same = features[field][block] @ features[field].T
+        scores += weights[field] * (1.0 - same)
+
+    interests = features["interests"]
+    counts = features["interest_counts"]
+    shared = interests[block] @ interests.T
+    union = counts[block, None] + counts[None, :] - shared
+    jaccard = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+    scores += weights["interests"] * (1.0 - jaccard)
+
+    years = features["grad_year"]
+    gap = np.abs(years[block, None] - years[None, :])
+    gap[np.isnan(gap)] = 0.0
+    scores += weights["grad_year"] * gap
+    return scores
+
+
+def matrix_buffer(n: int, dtype: Any = np.float64, path: Path | None = None) -> np.ndarray:
+    """
+    Allocate an n x n matrix, backed by a np.memmap scratch file when path is given.
+
+    A memmap lets the OS page the matrix to disk, so rosters whose score and
+    plan matrices exceed RAM can still be matched in a small container.
+    """
+    if path is None:
+        return np.empty((n, n), dtype=dtype)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return np.memmap(path, dtype=dtype, mode="w+", shape=(n, n))
+
+
+# Per-process state of score_matrix worker processes, set by _init_score_worker
+_score_worker: Dict[str, Any] = {}
+
+# Environment variables read by the BLAS / OpenMP runtimes behind NumPy's matmul
+_BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def _limit_blas_threads() -> None:
+    """
+    Run BLAS single-threaded in this process, so N score workers use N cores
+    rather than N times the BLAS thread count.
+
+    threadpoolctl (optional) limits runtimes that are already loaded; the
+    environment variables only reach runtimes loaded later.
+    """
+    for var in _BLAS_THREAD_VARS:
+        os.environ[var] = "1"
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=1)
+
+
+def _init_score_worker(
+    features: Dict[str, np.ndarray],
+    weights: Dict[str, float],
+    shape: tuple[int, int],
+    dtype: Any,
+    shm_name: str | None,
+    path: str | None,
+) -> None:
+    """Attach a worker process to the shared output matrix."""
+    _limit_blas_threads()
+    if path is not None:
+        out = np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+    else:
+        shm = SharedMemory(name=shm_name)
+        _score_worker["shm"] = shm
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _score_worker.update(features=features, weights=weights, out=out)
+
+
+def _score_block_task(start: int, stop: int) -> None:
+    state = _score_worker
+    state["out"][start:stop] = _score_rows(state["features"], start, stop, state["weights"])
+
+
+class _SharedMatrix:
+    """
+    Owner of the SharedMemory block behind a score matrix returned by
+    _score_parallel. Arrays built from it keep it alive through their base,
+    and it drops its own view before closing the block.
+    """
+
+    def __init__(self, shm: SharedMemory, shape: tuple[int, int], dtype: Any):
+        self._shm = shm
+        self._array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.__array_interface__ = self._array.__array_interface__
+
+    def __del__(self):
+        self._array = None
+        self._shm.close()
+
+
+def _score_parallel(
+    features: Dict[str, np.ndarray],
+    weights: Dict[str, float],
+    shape: tuple[int, int],
+    dtype: Any,
+    out: np.ndarray | None,
+    block_size: int,
+    workers: int,
+) -> np.ndarray:
+    """
+    Fill the score matrix row block by row block from a pool of worker processes.
+
+    Workers write into a file-backed memmap out directly. Without out, the
+    matrix is allocated in shared memory and returned as is, so the result
+    is never held twice; any other out is filled from a shared staging copy.
+    Blocks are sized so each worker gets about four, for load balancing.
+    """
+    n = shape[0]
+    block_size = max(1, min(block_size, -(-n // (workers * 4))))
+    blocks = [(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+    shm = None
+    if isinstance(out, np.memmap) and out.offset == 0 and out.filename:
+        target, shm_name, path = out, None, out.filename
+    else:
+        shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+        owner = _SharedMatrix(shm, shape, dtype)
+        target, shm_name, path = np.asarray(owner), shm.name, None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_score_worker,
+            initargs=(features, weights, shape, np.dtype(dtype), shm_name, path),
+        ) as pool:
+            for future in [pool.submit(_score_block_task, start, stop) for start, stop in blocks]:
+                future.result()
+    finally:
+        if shm is not None:
+            # The mapping outlives the name, so the block is freed with its last view
+            shm.unlink()
+    if out is not None and target is not out:
+        out[:] = target
+        return out
+    return target
+
+
+def score_matrix(
+    students: list[Student] | StudentTable,
+    weights: Dict[str, float] | None = None,
+    block_size: int = 1024,
+    out: np.ndarray | None = None,
+    workers: int = 1,
+    dtype: Any = np.float64,
+) -> np.ndarray:
+    """
+    Calculate the full pairwise match score matrix with batched NumPy operations.
+
+    Args:
+        students: List of students or a StudentTable; row/column i corresponds to students[i]
+        weights: Distance term weights (defaults to DEFAULT_WEIGHTS)
+        block_size: Number of rows computed per batch, bounding temporary memory
+            (with workers, blocks shrink to about n / (4 * workers) rows)
+        out: Optional n x n buffer to fill (e.g. a float32 matrix_buffer memmap)
+            instead of allocating a new matrix
+        workers: Number of processes computing row blocks in parallel, each
+            with single-threaded BLAS (via threadpoolctl when installed).
+            Blocks are written straight into a memmap out or into a shared
+            memory result; every row is computed the same way as in the
+            serial path, so results are bit-identical
+        dtype: dtype of the allocated matrix when out is not given; rows
+            are computed in float64 and rounded once when stored
+
+    Returns:
+        Matrix where scores[i, j] == match_score(students[i], students[j], weights)
+        for i != j, with a zero diagonal (exact for float64 buffers)
+    """
+    w = DEFAULT_WEIGHTS if weights is None else weights
+    features = encode_features(students)
+    n = len(students)
+    if workers > 1:
+        scores = _score_parallel(features, w, (n, n), dtype if out is None else out.dtype, out, block_size, workers)
+    else:
+        scores = np.zeros((n, n), dtype=dtype) if out is None else out
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            scores[start:stop] = _score_rows(features, start, stop, w)
+    np.fill_diagonal(scores, 0.0)
+    return scores
+
+
+def score_rows(
+    students: list[Student] | StudentTable,
+    start: int,
+    stop: int,
+    weights: Dict[str, float] | None = None,
+) -> np.ndarray:
+    """
+    Rows [start, stop) of score_matrix(students, weights), without computing the others.
+
+    Every entry equals the one score_matrix would compute, including the
+    zero diagonal.
+    """
+    w = DEFAULT_WEIGHTS if weights is None else weights
+    scores = _score_rows(encode_features(students), start, stop, w)
+    scores[np.arange(stop - start), np.arange(start, stop)] = 0.0
+    return scores
+
+
+# Sample data pools for realistic mock rosters
+_MOCK_FIRST_NAMES = [
+    "Alex", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Avery", "Quinn",
+    "Sam", "Cameron", "Dakota", "Skylar", "Blake", "Sage", "River", "Phoenix",
+    "Emma", "Olivia", "Noah", "Liam", "Sophia", "Ava", "Mia", "Isabella",
+    "James", "William", "Benjamin", "Lucas", "Henry", "Alexander", "Mason",
+    "Charlotte", "Amelia", "Harper", "Evelyn", "Abigail", "Emily", "Elizabeth"
+]
+
+_MOCK_LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas",
+    "Taylor", "Moore", "Jackson", "Martin", "Lee", "Thompson", "White", "Harris",
+    "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen",
+    "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green"
+]
+
+_MOCK_MAJORS = [
+    "Computer Science", "Engineering", "Mathematics", "Physics", "Chemistry",
+    "Biology", "Economics", "Political Science", "Psychology", "English",
+    "History", "Philosophy", "Art", "Music", "Business", "Medicine"
+]
+
+_MOCK_INTERESTS = [
+    "Music", "Sports", "Reading", "Gaming", "Cooking", "Travel", "Photography",
+    "Art", "Dancing", "Hiking", "Yoga", "Movies", "Theater", "Volunteering",
+    "Entrepreneurship", "Research", "Writing", "Fitness", "Meditation", "Chess"
+]
+
+_MOCK_DORMS = [
+    "Lagunita Court", "GovCo", "Florence Moore", "Stern", "Crothers", "Branner",
+    "Wilbur", "Casper"
+]
+
+_MOCK_INVOLVEMENTS = [
+    "Entrepreneurship", "Dance Groups", "Theater", "Club Sports", "Research Lab",
+    "Newspaper", "Robotics", "ACM", "Instrumental music", "Vocal", "Sustainability"
+]
+
+_MOCK_SEXES = ["male", "female", "non-binary"]
+
+_MOCK_CATEGORIES = {"major": _MOCK_MAJORS, "dorm": _MOCK_DORMS, "sex": _MOCK_SEXES}
+# Fixed so that the same seed always serializes to the same bytes (and the
+# same content hash, which keys the table and score caches)
+MOCK_CREATED_AT = "2025-01-01T00:00:00+00:00"
+
+
+def _mock_friend_graph(
+    rng: np.random.Generator,
+    dorm_codes: np.ndarray,
+    mean_friends: float,
+    dorm_affinity: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draw a directed close_friends graph clustered by dorm, as CSR (indptr, indices).
+
+    Each student names Poisson(mean_friends) friends; each friend lives in the
+    student's own dorm with probability dorm_affinity and is anyone otherwise.
+    Self-loops and repeated friends are dropped.
+    """
+    n = len(dorm_codes)
+    counts = rng.poisson(mean_friends, size=n) if n > 1 else np.zeros(n, dtype=np.int64)
+    rows = np.repeat(np.arange(n), counts)
+    friends = rng.integers(0, max(n, 1), size=len(rows))
+
+    # Same-dorm friends: a uniform pick among the rows sorted by dorm
+    by_dorm = np.argsort(dorm_codes, kind="stable")
+    dorm_sizes = np.bincount(dorm_codes, minlength=len(_MOCK_DORMS))
+    dorm_starts = np.concatenate([[0], np.cumsum(dorm_sizes)[:-1]])
+    same = rng.random(len(rows)) < dorm_affinity
+    dorm = dorm_codes[rows[same]]
+    offsets = (rng.random(int(same.sum())) * dorm_sizes[dorm]).astype(np.int64)
+    friends[same] = by_dorm[dorm_starts[dorm] + offsets]
+
+    keys = np.unique(rows[rows != friends] * n + friends[rows != friends])
+    rows, friends = np.divmod(keys, n)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, friends.astype(np.int32)
+
+
+def _mock_columns(
+    num_students: int,
+    seed: int | None,
+    mean_friends: float,
+    dorm_affinity: float,
+) -> Dict[str, Any]:
+    """Draw every column of a mock roster in bulk from one seeded Generator."""
+    rng = np.random.default_rng(seed)
+    n = num_students
+    first = rng.integers(len(_MOCK_FIRST_NAMES), size=n)
+    last = rng.integers(len(_MOCK_LAST_NAMES), size=n)
+    codes = {field: rng.integers(len(pool), size=n).astype(np.int32) for field, pool in _MOCK_CATEGORIES.items()}
+
+    # 1-5 distinct interests each: the first k of a random permutation of the pool
+    interest_counts = rng.integers(1, 6, size=n)
+    ranked = np.argsort(rng.random((n, len(_MOCK_INTERESTS))), axis=1)[:, :5]
+    interest_indices = ranked[np.arange(5)[None, :] < interest_counts[:, None]].astype(np.int32)
+    interest_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(interest_counts, out=interest_indptr[1:])
+
+    # Randomly decide if first/last name should be null (some students might not provide)
+    first_known = rng.random(n) > 0.1
+    last_known = rng.random(n) > 0.1
+
+    handles = [
+        f"{_MOCK_FIRST_NAMES[f].lower()}{_MOCK_LAST_NAMES[l].lower()}{i}"
+        for i, (f, l) in enumerate(zip(first.tolist(), last.tolist()))
+    ]
+    if mean_friends > 0:
+        friend_indptr, friend_indices = _mock_friend_graph(rng, codes["dorm"], mean_friends, dorm_affinity)
+    else:
+        friend_indptr, friend_indices = np.zeros(n + 1, dtype=np.int64), np.empty(0, dtype=np.int32)
+    return {
+        "ids": handles,
+        "first_names": [_MOCK_FIRST_NAMES[f] if known else None for f, known in zip(first.tolist(), first_known.tolist())],
+        "last_names": [_MOCK_LAST_NAMES[l] if known else None for l, known in zip(last.tolist(), last_known.tolist())],
+        "emails": [f"{handle}@stanford.edu" for handle in handles],
+        "grad_year": rng.integers(2024, 2031, size=n),
+        "codes": codes,
+        "interest_indptr": interest_indptr,
+        "interest_indices": interest_indices,
+        "involvements": rng.integers(len(_MOCK_INVOLVEMENTS), size=n),
+        "friend_indptr": friend_indptr,
+        "friend_indices": friend_indices,
+    }
 
 
 def generate_mock_dataset(
     num_students: int = 100,
     seed: int | None = None,
+    mean_friends: float = 0.0,
+    dorm_affinity: float = 0.8,
+    created_at: str | None = None,
 ) -> Dict[str, Any]:
     """
     Generate a mock dataset of college students with basic information.
     
+    Columns are drawn in bulk from a seeded numpy Generator, so the same seed
+    always yields the same students (see generate_mock_table for the same
+    roster as a StudentTable).
+    
     Args:
         num_students: Number of students to generate
         seed: Random seed for reproducibility
+        mean_friends: Average number of close_friends per student (0 leaves
+            every list empty)
+        dorm_affinity: Probability that a close friend lives in the same dorm
+        created_at: Timestamp stamped on every student (defaults to
+            MOCK_CREATED_AT)
     
     Returns:
         Dictionary with 'students' and 'matches' keys matching the dataset format
     """
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
-    
-    # Sample data pools for realistic generation
-    first_names = [
-        "Alex", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Avery", "Quinn",
-        "Sam", "Cameron", "Dakota", "Skylar", "Blake", "Sage", "River", "Phoenix",
-        "Emma", "Olivia", "Noah", "Liam", "Sophia", "Ava", "Mia", "Isabella",
-        "James", "William", "Benjamin", "Lucas", "Henry", "Alexander", "Mason",
-        "Charlotte", "Amelia", "Harper", "Evelyn", "Abigail", "Emily", "Elizabeth"
-    ]
-    
-    last_names = [
-        "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
-        "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas",
-        "Taylor", "Moore", "Jackson", "Martin", "Lee", "Thompson", "White", "Harris",
-        "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen",
-        "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green"
-    ]
-    
-    majors = [
-        "Computer Science", "Engineering", "Mathematics", "Physics", "Chemistry",
-        "Biology", "Economics", "Political Science", "Psychology", "English",
-        "History", "Philosophy", "Art", "Music", "Business", "Medicine"
-    ]
-    
-    interests_pool = [
-        "Music", "Sports", "Reading", "Gaming", "Cooking", "Travel", "Photography",
-        "Art", "Dancing", "Hiking", "Yoga", "Movies", "Theater", "Volunteering",
-        "Entrepreneurship", "Research", "Writing", "Fitness", "Meditation", "Chess"
-    ]
-    
-    dorms = [
-        "Lagunita Court", "GovCo", "Florence Moore", "Stern", "Crothers", "Branner",
-        "Wilbur", "Casper"
-    ]
-    
-    involvements_pool = [
-        "Entrepreneurship", "Dance Groups", "Theater", "Club Sports", "Research Lab", 
-        "Newspaper", "Robotics", "ACM", "Instrumental music", "Vocal", "Sustainability"
-    ]
-    
-    sex_options = ["male", "female", "non-binary"]
-    
-    # Generate student basic info
-    students = []
-    
-    for i in range(num_students):
-        # Generate unique ID (similar to email handle)
-        first_name = random.choice(first_names)
-        last_name = random.choice(last_names)
-        handle = f"{first_name.lower()}{last_name.lower()}{i}"
-        student_id = handle
-        
-        email = f"{handle}@stanford.edu"
-        grad_year = random.randint(2024, 2030)
-        major = random.choice(majors)
-        sex = random.choice(sex_options)
-        dorm = random.choice(dorms)
-        involvements = random.choice(involvements_pool)
-        
-        # Generate 1-5 interests
-        num_interests = random.randint(1, 5)
-        interests = random.sample(interests_pool, num_interests)
-        
-        # Randomly decide if first/last name should be null (some students might not provide)
-        first_name_val = first_name if random.random() > 0.1 else None
-        last_name_val = last_name if random.random() > 0.1 else None
-        
-        student = {
-            "id": student_id,
-            "first_name": first_name_val,
-            "last_name": last_name_val,
-            "email": email,
-            "grad_year": grad_year,
-            "major": major,
-            "interests": interests,
-            "sex": sex,
-            "dorm": dorm,
-            "involvements": involvements,
-            "close_friends": [],  # Empty - scoring handled by match_score function
+    columns = _mock_columns(num_students, seed, mean_friends, dorm_affinity)
+    created_at = created_at or MOCK_CREATED_AT
+    ids = columns["ids"]
+    interest_indptr = columns["interest_indptr"].tolist()
+    interest_indices = columns["interest_indices"].tolist()
+    friend_indptr = columns["friend_indptr"].tolist()
+    friend_indices = columns["friend_indices"].tolist()
+    codes = {field: values.tolist() for field, values in columns["codes"].items()}
+    grad_year = columns["grad_year"].tolist()
+    involvements = columns["involvements"].tolist()
+
+    students = [
+        {
+            "id": ids[i],
+            "first_name": columns["first_names"][i],
+            "last_name": columns["last_names"][i],
+            "email": columns["emails"][i],
+            "grad_year": grad_year[i],
+            "major": _MOCK_MAJORS[codes["major"][i]],
+            "interests": [_MOCK_INTERESTS[k] for k in interest_indices[interest_indptr[i]:interest_indptr[i + 1]]],
+            "sex": _MOCK_SEXES[codes["sex"][i]],
+            "dorm": _MOCK_DORMS[codes["dorm"][i]],
+            "involvements": _MOCK_INVOLVEMENTS[involvements[i]],
+            "close_friends": [ids[k] for k in friend_indices[friend_indptr[i]:friend_indptr[i + 1]]],
             "survey_completed": True,
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": created_at,
         }
-        students.append(student)
+        for i in range(num_students)
+    ]
     
     return {
         "students": students,
@@ -122,75 +510,765 @@ def generate_mock_dataset(
     }
 
 
-def sinkhorn_matching(
+def generate_mock_table(
+    num_students: int = 100,
+    seed: int | None = None,
+    mean_friends: float = 0.0,
+    dorm_affinity: float = 0.8,
+) -> StudentTable:
+    """
+    Generate the roster of generate_mock_dataset (same arguments, same seed)
+    directly as a StudentTable, without building per-student dicts.
+    """
+    columns = _mock_columns(num_students, seed, mean_friends, dorm_affinity)
+    return StudentTable(
+        ids=columns["ids"],
+        first_names=columns["first_names"],
+        last_names=columns["last_names"],
+        emails=columns["emails"],
+        grad_year=columns["grad_year"].astype(float),
+        categories={field: list(pool) for field, pool in _MOCK_CATEGORIES.items()},
+        codes=columns["codes"],
+        interest_vocab=list(_MOCK_INTERESTS),
+        interest_indptr=columns["interest_indptr"],
+        interest_indices=columns["interest_indices"],
+        involvements=[_MOCK_INVOLVEMENTS[k] for k in columns["involvements"].tolist()],
+        friend_indptr=columns["friend_indptr"],
+        friend_indices=columns["friend_indices"],
+        survey_completed=np.ones(num_students, dtype=bool),
+    )
+
+
+def _scaled_block(log_kernel: np.ndarray, scale: float, start: int, stop: int) -> np.ndarray:
+    """A fresh copy of scale * log_kernel[start:stop]."""
+    if scale == 1.0:
+        return np.array(log_kernel[start:stop])
+    return np.multiply(log_kernel[start:stop], scale)
+
+
+def _row_logsumexp(log_kernel: np.ndarray, scale: float, log_v: np.ndarray, block_size: int) -> np.ndarray:
+    """
+    log(sum_j exp(scale * log_kernel[i, j] + log_v[j])) for every row i; all -inf gives -inf.
+
+    Rows are processed block_size at a time, so the only temporary is one
+    block_size x n block, exponentiated in place.
+    """
+    n = log_kernel.shape[0]
+    out = np.empty(n, dtype=np.result_type(log_kernel, log_v))
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = _scaled_block(log_kernel, scale, start, stop)
+        block += log_v[None, :]
+        peak = block.max(axis=1)
+        peak[~np.isfinite(peak)] = 0.0
+        block -= peak[:, None]
+        np.exp(block, out=block)
+        with np.errstate(divide="ignore"):
+            out[start:stop] = np.log(block.sum(axis=1)) + peak
+    return out
+
+
+def _column_logsumexp(log_kernel: np.ndarray, scale: float, log_u: np.ndarray, block_size: int) -> np.ndarray:
+    """
+    log(sum_i exp(scale * log_kernel[i, j] + log_u[i])) for every column j; all -inf gives -inf.
+
+    Accumulated over row blocks with a running per-column peak, so the only
+    temporary is one block_size x n block.
+    """
+    n = log_kernel.shape[0]
+    dtype = np.result_type(log_kernel, log_u)
+    peak = np.full(log_kernel.shape[1], -np.inf, dtype=dtype)
+    total = np.zeros(log_kernel.shape[1], dtype=dtype)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = _scaled_block(log_kernel, scale, start, stop)
+        block += log_u[start:stop, None]
+        new_peak = np.maximum(peak, block.max(axis=0))
+        shift = np.where(np.isfinite(new_peak), new_peak, 0.0)
+        total *= np.exp(peak - shift)
+        block -= shift[None, :]
+        np.exp(block, out=block)
+        total += block.sum(axis=0)
+        peak = new_peak
+    with np.errstate(divide="ignore"):
+        return np.log(total) + np.where(np.isfinite(peak), peak, 0.0)
+
+
+# Share of a float32 kernel's finite entries allowed below the smallest
+# normal float (after the row shift) before the linear method builds the
+# kernel in float64 instead; those entries are flushed to zero, since
+# subnormal arithmetic slows every matrix-vector product
+MAX_SUBNORMAL_SHARE = 0.01
+
+
+def _row_min_costs(cost_matrix: np.ndarray) -> np.ndarray:
+    """Each row's cheapest finite cost (0 for rows with none)."""
+    row_min = cost_matrix.min(axis=1)
+    row_min[~np.isfinite(row_min)] = 0.0
+    return row_min
+
+
+def _subnormal_share(cost_matrix: np.ndarray, row_min: np.ndarray, lambda_reg: float, dtype: Any, block_size: int = 1024) -> float:
+    """Share of the finite entries of exp(-lambda_reg * (cost - row_min)) below dtype's smallest normal."""
+    limit = -np.log(np.finfo(dtype).tiny) / lambda_reg
+    finite = lost = 0
+    for start in range(0, cost_matrix.shape[0], block_size):
+        stop = min(start + block_size, cost_matrix.shape[0])
+        shifted = cost_matrix[start:stop] - row_min[start:stop, None]
+        is_finite = np.isfinite(shifted)
+        finite += int(is_finite.sum())
+        lost += int((is_finite & (shifted > limit)).sum())
+    return lost / finite if finite else 0.0
+
+
+def _kernel_underflows(cost_matrix: np.ndarray, lambda_reg: float, dtype: Any) -> bool:
+    """
+    Whether exp(-lambda_reg * cost) in dtype underflows to zero across a
+    whole row that has finite costs (the scalings would then overflow too).
+    """
+    row_min = cost_matrix.min(axis=1)
+    row_min = row_min[np.isfinite(row_min)]
+    return bool(row_min.size) and lambda_reg * float(row_min.max()) > -np.log(np.finfo(dtype).tiny)
+
+
+def _relaxation_exponent(lambda_reg: float, marginal_penalty: float | None) -> float:
+    """Exponent of the unbalanced scaling updates, penalty / (penalty + 1 / lambda_reg); 1 when unrelaxed."""
+    if marginal_penalty is None:
+        return 1.0
+    return marginal_penalty * lambda_reg / (marginal_penalty * lambda_reg + 1.0)
+
+
+class ConvergenceMonitor:
+    """
+    Schedules Sinkhorn convergence checks and decides when to stop.
+
+    By default the marginal error is checked every check_every iterations
+    and the run stops once it drops below tolerance. With adaptive set, the
+    next check is moved earlier when the error trend (its geometric decay
+    rate between the last two checks) predicts tolerance will be met sooner,
+    so a run stops within an iteration or two of converging instead of up to
+    check_every - 1 iterations late. With patience set, the run also stops
+    (as stalled) after that many consecutive checks without a 1% improvement.
+    With check_last set, the final iteration is always checked, so the last
+    entry of errors is the error of the returned scalings.
+
+    Every check is recorded in errors as (iteration, error), and passed to
+    callback.
+    """
+
+    def __init__(
+        self,
+        tolerance: float,
+        check_every: int = 10,
+        callback: Callable[[int, float], None] | None = None,
+        adaptive: bool = False,
+        patience: int | None = None,
+        check_last: bool = False,
+    ):
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.callback = callback
+        self.adaptive = adaptive
+        self.patience = patience
+        self.check_last = check_last
+        self.errors: list[tuple[int, float]] = []
+        self.start()
+
+    def start(self, max_iterations: int = 0) -> None:
+        """Reset the schedule for a new solve (e.g. the next epsilon stage); errors are kept."""
+        self.max_iterations = max_iterations
+        self.next_check = self.check_every
+        self.converged = False
+        self.stalled = False
+        self._best = np.inf
+        self._stale = 0
+        self._last: tuple[int, float] | None = None
+
+    def due(self, iteration: int) -> bool:
+        return iteration >= self.next_check or (self.check_last and iteration == self.max_iterations)
+
+    def record(self, iteration: int, error: float) -> bool:
+        """Record a check; returns True when the run should stop."""
+        self.errors.append((iteration, error))
+        if self.callback is not None:
+            self.callback(iteration, error)
+        if error < self.tolerance:
+            self.converged = True
+            return True
+        if self.patience is not None:
+            if error < 0.99 * self._best:
+                self._best = error
+                self._stale = 0
+            else:
+                self._stale += 1
+                if self._stale >= self.patience:
+                    self.stalled = True
+                    return True
+
+        step = self.check_every
+        if self.adaptive and self._last is not None and 0.0 < error < self._last[1]:
+            rate = (error / self._last[1]) ** (1.0 / (iteration - self._last[0]))
+            if rate < 1.0:
+                predicted = np.ceil(np.log(self.tolerance / error) / np.log(rate))
+                step = int(min(max(predicted, 1), self.check_every))
+        self._last = (iteration, error)
+        self.next_check = iteration + step
+        return False
+
+
+def sinkhorn_scalings(
+    kernel: np.ndarray,
+    u: np.ndarray,
+    v: np.ndarray,
+    max_iterations: int = 1000,
+    tolerance: float = 1e-6,
+    check_every: int = 10,
+    callback: Callable[[int, float], None] | None = None,
+    marginals: np.ndarray | None = None,
+    exponent: float = 1.0,
+    monitor: ConvergenceMonitor | None = None,
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Run linear-domain Sinkhorn updates on a dense or sparse kernel; returns (u, v, iterations).
+
+    This is the solver loop of sinkhorn_matching, for callers that build and
+    keep their own kernel (e.g. to warm-start from u and v as it changes).
+    marginals are the target row and column sums (ones by default). An
+    exponent below 1 relaxes them to a KL penalty (unbalanced Sinkhorn), and
+    the convergence error is then the residual of the u update. A monitor,
+    if given, replaces tolerance, check_every and callback.
+    """
+    if monitor is None:
+        monitor = ConvergenceMonitor(tolerance, check_every, callback)
+    monitor.start(max_iterations)
+    target = 1.0 if marginals is None else marginals
+    active = (kernel @ np.ones(kernel.shape[1], dtype=kernel.dtype)) > 0
+    if marginals is not None:
+        active &= marginals > 0
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        # u = a / (K @ v) ensures each row of diag(u) @ K @ diag(v) sums to a
+        u = target / (kernel @ v + 1e-16)
+        if exponent != 1.0:
+            u **= exponent
+        # v = a / (K.T @ u) ensures each column of diag(u) @ K @ diag(v) sums to a
+        v = target / (kernel.T @ u + 1e-16)
+        if exponent != 1.0:
+            v **= exponent
+
+        # Columns are exact after the v update, so only the row marginals can be off
+        if monitor.due(iteration):
+            row_sums = kernel @ v
+            if exponent == 1.0:
+                expected = target
+            else:
+                expected = target ** exponent * (row_sums + 1e-16) ** (1.0 - exponent)
+            row_error = np.abs(u * row_sums - expected)[active]
+            if monitor.record(iteration, float(row_error.max()) if row_error.size else 0.0):
+                break
+    return u, v, iteration
+
+
+def _sinkhorn_log(
+    log_kernel: np.ndarray,
+    scale: float,
+    log_u: np.ndarray,
+    log_v: np.ndarray,
+    max_iterations: int,
+    tolerance: float,
+    check_every: int,
+    callback: Callable[[int, float], None] | None = None,
+    marginals: np.ndarray | None = None,
+    exponent: float = 1.0,
+    monitor: ConvergenceMonitor | None = None,
+    block_size: int = 1024,
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Run log-domain Sinkhorn updates on the log-kernel scale * log_kernel; returns (log_u, log_v, iterations).
+
+    Every logsumexp runs over row blocks, so beyond log_kernel itself only a
+    block_size x n temporary is allocated. See sinkhorn_scalings for
+    marginals and monitor.
+    """
+    if monitor is None:
+        monitor = ConvergenceMonitor(tolerance, check_every, callback)
+    monitor.start(max_iterations)
+    n = log_kernel.shape[0]
+    active = np.concatenate([
+        np.isfinite(log_kernel[start:min(start + block_size, n)]).any(axis=1)
+        for start in range(0, n, block_size)
+    ]) if n else np.zeros(0, dtype=bool)
+    if marginals is None:
+        log_target = 0.0
+        empty = np.zeros(len(active), dtype=bool)
+    else:
+        empty = marginals <= 0
+        with np.errstate(divide="ignore"):
+            log_target = np.log(marginals)
+        active &= ~empty
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        log_u = exponent * (log_target - _row_logsumexp(log_kernel, scale, log_v, block_size))
+        log_u[~active] = 0.0
+        log_u[empty] = -np.inf
+        log_v = exponent * (log_target - _column_logsumexp(log_kernel, scale, log_u, block_size))
+        log_v[~np.isfinite(log_v)] = 0.0
+        log_v[empty] = -np.inf
+
+        if monitor.due(iteration):
+            log_row = _row_logsumexp(log_kernel, scale, log_v, block_size)
+            row_sums = np.exp(log_u + log_row)
+            if exponent == 1.0:
+                expected = np.exp(log_target)
+            else:
+                expected = np.exp(exponent * log_target + (1.0 - exponent) * log_row)
+            row_error = np.abs(row_sums - expected)[active]
+            if monitor.record(iteration, float(row_error.max()) if row_error.size else 0.0):
+                break
+    return log_u, log_v, iteration
+
+
+def _top_k_kernel(
+    cost_matrix: np.ndarray,
+    lambda_reg: float,
+    top_k: int,
+    block_size: int = 1024,
+    dtype: Any = None,
+):
+    """
+    Build a sparse CSR kernel restricted to each row's top_k lowest-cost partners.
+
+    The candidate set is symmetrized (if j is in i's top_k, i is kept in j's
+    row too) and forbidden (infinite-cost) pairs are dropped. Entries are
+    stored in dtype (default: the cost matrix's).
+    """
+    from scipy import sparse
+
+    n = cost_matrix.shape[0]
+    k = min(top_k, n)
+    keys = []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = cost_matrix[start:stop]
+        cols = np.argpartition(block, k - 1, axis=1)[:, :k]
+        rows = np.broadcast_to(np.arange(start, stop)[:, None], cols.shape)
+        finite = np.isfinite(np.take_along_axis(block, cols, axis=1))
+        keys.append(rows[finite] * n + cols[finite])
+        keys.append(cols[finite] * n + rows[finite])
+    keys = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=int)
+    rows, cols = np.divmod(keys, n)
+    costs = cost_matrix[rows, cols]
+    finite = np.isfinite(costs)
+    data = np.exp(-lambda_reg * costs[finite].astype(dtype or cost_matrix.dtype))
+    return sparse.csr_matrix((data, (rows[finite], cols[finite])), shape=(n, n))
+
+
+class SinkhornPlan:
+    """
+    Lazy view of the transport plan diag(u) @ K @ diag(v).
+
+    Holds the kernel and scaling vectors instead of the n x n plan, and
+    materializes rows on demand. The kernel may be a scipy.sparse matrix.
+    With log_domain set, kernel, u and v hold the log-kernel and log-scalings.
+    iterations records how many Sinkhorn iterations produced the scalings.
+    """
+
+    def __init__(self, kernel: np.ndarray, u: np.ndarray, v: np.ndarray, log_domain: bool = False, iterations: int = 0):
+        self.kernel = kernel
+        self.u = u
+        self.v = v
+        self.log_domain = log_domain
+        self.iterations = iterations
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.kernel.shape
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Return rows [start, stop) of the plan as a new dense array."""
+        if hasattr(self.kernel, "toarray"):
+            block = self.kernel[start:stop].toarray()
+            block *= self.u[start:stop, None]
+            block *= self.v[None, :]
+            return block
+        if self.log_domain:
+            block = self.kernel[start:stop] + self.u[start:stop, None]
+            block += self.v[None, :]
+            return np.exp(block, out=block)
+        block = self.kernel[start:stop] * self.u[start:stop, None]
+        block *= self.v[None, :]
+        return block
+
+    def entries(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Return the plan entries at the given (row, col) index pairs."""
+        if hasattr(self.kernel, "toarray"):
+            values = np.asarray(self.kernel[rows, cols], dtype=float).ravel()
+        else:
+            values = self.kernel[rows, cols]
+        if self.log_domain:
+            return np.exp(self.u[rows] + values + self.v[cols])
+        return self.u[rows] * values * self.v[cols]
+
+    def row(self, i: int) -> np.ndarray:
+        """Return row i of the plan."""
+        return self.rows(i, i + 1)[0]
+
+    def to_dense(self) -> np.ndarray:
+        """Materialize the full plan."""
+        return self.rows(0, self.shape[0])
+
+
+def plan_rows(matrix: Any, start: int, stop: int) -> np.ndarray:
+    """Return rows [start, stop) of a dense, sparse or lazy (SinkhornPlan) matrix as a new dense array."""
+    if isinstance(matrix, SinkhornPlan):
+        return matrix.rows(start, stop)
+    block = matrix[start:stop]
+    if hasattr(block, "toarray"):
+        return block.toarray()
+    return np.array(block)
+
+
+def matrix_entries(matrix: Any, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Gather matrix[rows, cols] from a dense, sparse or lazy (SinkhornPlan) matrix."""
+    if isinstance(matrix, SinkhornPlan):
+        return matrix.entries(rows, cols)
+    if hasattr(matrix, "nnz"):
+        return np.asarray(matrix[rows, cols], dtype=float).ravel()
+    return np.asarray(matrix[rows, cols])
+
+
+class SinkhornResult:
+    """
+    Outcome of a solve_sinkhorn run.
+
+    plan is what sinkhorn_matching returns (a matrix, or a SinkhornPlan
+    when lazy), u and v the final scalings (log-scalings for
+    method="log"), and iterations the total across epsilon stages.
+    converged says whether the final stage met the tolerance; stalled that
+    it stopped early for lack of progress (stall_patience) instead. method
+    is the method that ran, and u and v are in the dtype it solved in.
+    marginal_error is the max row marginal error of the returned plan, and
+    errors the (iteration, error) trace of every convergence check.
+    """
+
+    def __init__(
+        self,
+        plan: Any,
+        u: np.ndarray,
+        v: np.ndarray,
+        iterations: int,
+        converged: bool,
+        stalled: bool,
+        marginal_error: float,
+        errors: list[tuple[int, float]],
+        method: str = "linear",
+    ):
+        self.plan = plan
+        self.u = u
+        self.v = v
+        self.iterations = iterations
+        self.converged = converged
+        self.stalled = stalled
+        self.marginal_error = marginal_error
+        self.errors = errors
+        self.method = method
+
+
+def _sinkhorn_result(
+    plan: Any,
+    u: np.ndarray,
+    v: np.ndarray,
+    iterations: int,
+    monitor: ConvergenceMonitor,
+    method: str,
+) -> SinkhornResult:
+    marginal_error = monitor.errors[-1][1] if monitor.errors else float("nan")
+    return SinkhornResult(
+        plan, u, v, iterations,
+        converged=monitor.converged,
+        stalled=monitor.stalled,
+        marginal_error=marginal_error,
+        errors=monitor.errors,
+        method=method,
+    )
+
+
+def solve_sinkhorn(
     scores: np.ndarray,
-    students: list[Student],
+    students: list[Student] | StudentTable,
     lambda_reg: float = 1.0,
     max_iterations: int = 1000,
     tolerance: float = 1e-6,
-) -> np.ndarray:
+    method: str = "linear",
+    check_every: int = 10,
+    epsilon_steps: int = 0,
+    init_u: np.ndarray | None = None,
+    init_v: np.ndarray | None = None,
+    lazy: bool = False,
+    top_k: int = 50,
+    exclusions: ExclusionIndex | None = None,
+    in_place: bool = False,
+    callback: Callable[[int, float], None] | None = None,
+    capacities: np.ndarray | None = None,
+    marginal_penalty: float | None = None,
+    adaptive: bool = False,
+    stall_patience: int | None = None,
+    dtype: Any = None,
+) -> SinkhornResult:
     """
     Apply Sinkhorn algorithm to find optimal matching pairs.
     
     Args:
         scores: Distance matrix where scores[i, j] is match_score between students[i] and students[j]
-        students: List of students in the same order as the scores matrix
-        lambda_reg: Regularization parameter (higher = more entropy, softer matching)
-        max_iterations: Maximum number of Sinkhorn iterations
-        tolerance: Convergence tolerance
+        students: List of students (or a StudentTable) in the same order as the scores matrix
+        lambda_reg: Regularization parameter (higher = sharper matching, lower = more entropy)
+        max_iterations: Maximum number of Sinkhorn iterations (per epsilon stage)
+        tolerance: Convergence tolerance on the maximum row marginal error
+        method: "linear" for the classic kernel iterations, "log" for the
+            stabilized logsumexp iterations that do not underflow at high lambda_reg,
+            or "sparse" for linear iterations on a top_k candidate CSR kernel
+            (requires scipy)
+        check_every: Check convergence every this many iterations
+        epsilon_steps: Log method only; number of warm-up stages solved at
+            lambda_reg / 2**k before the target lambda_reg (epsilon-scaling)
+        init_u: Warm-start row scalings from a previous run (log-scalings
+            when method="log"); defaults to ones
+        init_v: Warm-start column scalings, same convention as init_u
+        lazy: Make the plan a SinkhornPlan holding the kernel and scalings
+            instead of materializing it
+        top_k: Sparse method only; number of lowest-cost partners kept per
+            student before symmetric closure
+        exclusions: Prebuilt ExclusionIndex for the forbidden pairs (e.g. with
+            FriendGraph.second_degree pairs added); defaults to one built from
+            the students' close_friends lists
+        in_place: Reuse the scores buffer as the cost matrix, kernel and plan
+            instead of copying it (scores is overwritten). Combined with a
+            float32 matrix_buffer memmap this keeps a single n x n matrix,
+            in its dtype, for every method (the log method also allocates
+            one 1024 x n block per logsumexp)
+        callback: Called as callback(iteration, max row marginal error) at
+            every convergence check (every iteration with check_every=1)
+        capacities: Per-student number of matches wanted this round, used as
+            both the row and the column marginals (0 opts a student out,
+            2 asks for two matches); defaults to one each
+        marginal_penalty: Relax the marginals to a KL penalty of this
+            strength (unbalanced Sinkhorn), so capacities no pairing can meet
+            are only approximately honored instead of stalling convergence;
+            None keeps them as hard constraints
+        adaptive: Schedule convergence checks from the observed error decay,
+            checking more often (up to every iteration) when tolerance is
+            predicted within check_every iterations, so runs stop closer to
+            the iteration they converge at
+        stall_patience: Stop early after this many consecutive convergence
+            checks without a 1% improvement in the marginal error
+        dtype: Precision of the cost matrix, kernel and scalings, e.g.
+            np.float32 to halve memory and the bandwidth of every
+            matrix-vector product; defaults to the dtype of scores. Below
+            float64, the linear method solves on each row's kernel divided
+            by its largest entry, flushing the entries that are still
+            subnormal, and builds the kernel in float64 instead when more
+            than MAX_SUBNORMAL_SHARE of them would be; the sparse method
+            keeps its few kernel entries in float64 when a whole row would
+            underflow. The
+            tolerance is floored at eps * sqrt(n) of the dtype, the
+            rounding noise of a row sum, so float32 runs can converge
     
     Returns:
-        Doubly stochastic matrix representing the matching probabilities
+        A SinkhornResult whose plan is the doubly stochastic matrix of
+        matching probabilities (rows and columns summing to capacities when
+        given; a scipy.sparse CSR matrix for method="sparse", a SinkhornPlan
+        if lazy is set), with the final scalings (for warm-starting a later
+        run), iteration count, converged flag and marginal-error trace. The
+        final iteration is always checked, so marginal_error is exact.
     """
+    if method not in ("linear", "log", "sparse"):
+        raise ValueError(f"Unknown Sinkhorn method: {method}")
+    if epsilon_steps and method != "log":
+        raise ValueError("epsilon_steps requires method='log'")
+
     n = len(students)
+    if capacities is not None:
+        capacities = np.asarray(capacities, dtype=float)
+        if capacities.shape != (n,) or (capacities < 0).any():
+            raise ValueError("capacities must be one non-negative value per student")
     
     # Create cost matrix from scores (match_score is distance, so lower is better)
-    cost_matrix = scores.copy()
+    if in_place:
+        if dtype is not None and np.dtype(dtype) != scores.dtype:
+            raise ValueError(f"in_place needs scores in the requested dtype, got {scores.dtype} for {np.dtype(dtype)}")
+        cost_matrix = scores
+    else:
+        cost_matrix = np.array(scores, dtype=dtype)
+    # Scalings of the log and sparse methods stay float64 unless a dtype is requested
+    scaling_dtype = np.float64 if dtype is None else cost_matrix.dtype
     
-    # Set very high cost for pairs that are already close friends
-    # Also set high cost for self-pairs
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                cost_matrix[i, j] = np.inf
-            elif students[i].close_friends and students[j].id in students[i].close_friends:
-                # If student i has student j as close friend, don't match them
-                cost_matrix[i, j] = np.inf
-            elif students[j].close_friends and students[i].id in students[j].close_friends:
-                # If student j has student i as close friend, don't match them
-                cost_matrix[i, j] = np.inf
+    # Set infinite cost for self-pairs and pairs that are already close friends
+    if exclusions is None:
+        exclusions = ExclusionIndex.from_students(students)
+    exclusions.apply(cost_matrix)
+    kernel_dtype = None
+    row_shift = None
+    if np.finfo(cost_matrix.dtype).bits < 64 and method == "linear":
+        # Solve on exp(-lambda * (cost - row_min)), whose rows all peak at 1,
+        # and fold exp(lambda * row_min) back into u; if too many entries
+        # would still be subnormal, build the kernel in float64 instead
+        row_shift = _row_min_costs(cost_matrix)
+        if _subnormal_share(cost_matrix, row_shift, lambda_reg, cost_matrix.dtype) > MAX_SUBNORMAL_SHARE:
+            kernel_dtype = np.float64
+            row_shift = None
+        else:
+            cost_matrix -= row_shift[:, None]
+    elif np.finfo(cost_matrix.dtype).bits < 64 and method == "sparse":
+        if _kernel_underflows(cost_matrix, lambda_reg, cost_matrix.dtype):
+            kernel_dtype = scaling_dtype = np.float64
+    if np.finfo(cost_matrix.dtype).bits < 64:
+        tolerance = max(tolerance, float(np.finfo(cost_matrix.dtype).eps * np.sqrt(n)))
+    monitor = ConvergenceMonitor(tolerance, check_every, callback, adaptive, stall_patience, check_last=True)
     
-    # Initialize kernel matrix: K = exp(-lambda * cost)
-    # Use a large value for inf costs to effectively zero them out
-    kernel = np.exp(-lambda_reg * cost_matrix)
-    kernel[np.isinf(cost_matrix)] = 0.0
+    if method == "log":
+        log_u = np.zeros(n, dtype=scaling_dtype) if init_u is None else np.asarray(init_u, dtype=scaling_dtype)
+        log_v = np.zeros(n, dtype=scaling_dtype) if init_v is None else np.asarray(init_v, dtype=scaling_dtype)
+        if capacities is not None:
+            capacities = capacities.astype(scaling_dtype)
+        # Turn the private cost matrix copy (or the caller's in_place buffer)
+        # into the log-kernel once; stages at a lower lambda scale it per block
+        log_kernel = np.multiply(cost_matrix, -lambda_reg, out=cost_matrix)
+        # Solve coarser (higher-entropy) problems first; the dual potentials
+        # log_u / lambda carry over between stages
+        stage_lambda = lambda_reg / 2 ** epsilon_steps
+        log_u = log_u * (stage_lambda / lambda_reg)
+        log_v = log_v * (stage_lambda / lambda_reg)
+        iterations = 0
+        for _ in range(epsilon_steps):
+            log_u, log_v, stage_iterations = _sinkhorn_log(
+                log_kernel, stage_lambda / lambda_reg, log_u, log_v,
+                max_iterations, tolerance, check_every, callback,
+                capacities, _relaxation_exponent(stage_lambda, marginal_penalty), monitor,
+            )
+            iterations += stage_iterations
+            log_u, log_v = 2.0 * log_u, 2.0 * log_v
+            stage_lambda *= 2.0
+        log_u, log_v, stage_iterations = _sinkhorn_log(
+            log_kernel, 1.0, log_u, log_v,
+            max_iterations, tolerance, check_every, callback,
+            capacities, _relaxation_exponent(lambda_reg, marginal_penalty), monitor,
+        )
+        iterations += stage_iterations
+        if lazy:
+            plan = SinkhornPlan(log_kernel, log_u, log_v, log_domain=True, iterations=iterations)
+            return _sinkhorn_result(plan, log_u, log_v, iterations, monitor, method)
+        # Turn the log-kernel into the plan in place
+        matching_matrix = log_kernel
+        matching_matrix += log_u[:, None]
+        matching_matrix += log_v[None, :]
+        np.exp(matching_matrix, out=matching_matrix)
+        return _sinkhorn_result(matching_matrix, log_u, log_v, iterations, monitor, method)
+
+    if method == "sparse":
+        kernel = _top_k_kernel(cost_matrix, lambda_reg, top_k, dtype=kernel_dtype)
+        del cost_matrix
+        u = np.ones(n, dtype=scaling_dtype) if init_u is None else np.asarray(init_u, dtype=scaling_dtype)
+        v = np.ones(n, dtype=scaling_dtype) if init_v is None else np.asarray(init_v, dtype=scaling_dtype)
+        if capacities is not None:
+            capacities = capacities.astype(scaling_dtype)
+        u, v, iterations = sinkhorn_scalings(
+            kernel, u, v, max_iterations, tolerance, check_every, callback,
+            capacities, _relaxation_exponent(lambda_reg, marginal_penalty), monitor,
+        )
+        if lazy:
+            plan = SinkhornPlan(kernel, u, v, iterations=iterations)
+            return _sinkhorn_result(plan, u, v, iterations, monitor, method)
+        # Scale the stored entries in place: P_ij = u_i * K_ij * v_j
+        kernel.data *= np.repeat(u, np.diff(kernel.indptr))
+        kernel.data *= v[kernel.indices]
+        return _sinkhorn_result(kernel, u, v, iterations, monitor, method)
+
+    # Turn the cost matrix into the kernel K = exp(-lambda * cost) in place;
+    # infinite costs become exactly zero
+    if kernel_dtype is None:
+        kernel = np.multiply(cost_matrix, -lambda_reg, out=cost_matrix)
+    else:
+        kernel = np.multiply(cost_matrix, -lambda_reg, dtype=kernel_dtype)
+        del cost_matrix
+    np.exp(kernel, out=kernel)
     kernel[np.isnan(kernel)] = 0.0
+    if row_shift is not None:
+        # Flush the few subnormal entries (at most MAX_SUBNORMAL_SHARE) to
+        # zero; they are below the precision the float32 solve keeps anyway
+        tiny = np.finfo(kernel.dtype).tiny
+        for start in range(0, n, 1024):
+            block = kernel[start:start + 1024]
+            block[block < tiny] = 0.0
+        # u of the shifted kernel times exp(lambda * row_min) scales the
+        # unshifted one; in float64, where that factor does not overflow
+        fold = np.exp(lambda_reg * row_shift.astype(np.float64))
     
-    # Initialize scaling vectors (start with ones)
-    u = np.ones(n)
-    v = np.ones(n)
+    # Initialize scaling vectors (start with ones unless warm-starting) in the
+    # kernel's dtype, so matrix-vector products never upcast the kernel
+    u = np.ones(n, dtype=kernel.dtype) if init_u is None else np.asarray(init_u, dtype=kernel.dtype)
+    v = np.ones(n, dtype=kernel.dtype) if init_v is None else np.asarray(init_v, dtype=kernel.dtype)
+    if row_shift is not None and init_u is not None:
+        u = (np.asarray(init_u, dtype=np.float64) / fold).astype(kernel.dtype)
+    marginals = None if capacities is None else capacities.astype(kernel.dtype)
+    u, v, iterations = sinkhorn_scalings(
+        kernel, u, v, max_iterations, tolerance, check_every, callback,
+        marginals, _relaxation_exponent(lambda_reg, marginal_penalty), monitor,
+    )
+    # The result's u always scales the unshifted kernel exp(-lambda * cost)
+    result_u = u if row_shift is None else u * fold
     
-    # Sinkhorn iterations: normalize rows and columns alternately
-    for iteration in range(max_iterations):
-        # Update u: normalize rows to sum to 1
-        u_prev = u.copy()
-        v_prev = v.copy()
-        
-        # u = 1 / (K @ v) ensures each row of diag(u) @ K @ diag(v) sums to 1
-        u = 1.0 / (kernel @ v + 1e-16)
-        
-        # v = 1 / (K.T @ u) ensures each column of diag(u) @ K @ diag(v) sums to 1
-        v = 1.0 / (kernel.T @ u + 1e-16)
-        
-        # Check convergence
-        u_change = np.max(np.abs(u - u_prev))
-        v_change = np.max(np.abs(v - v_prev))
-        if u_change < tolerance and v_change < tolerance:
-            break
+    if lazy:
+        plan = SinkhornPlan(kernel, u, v, iterations=iterations)
+        return _sinkhorn_result(plan, result_u, v, iterations, monitor, method)
     
     # Compute final doubly stochastic matrix: P = diag(u) @ K @ diag(v)
-    # This ensures each row and column sums to 1
-    matching_matrix = np.diag(u) @ kernel @ np.diag(v)
+    # by scaling the kernel rows and columns in place with broadcasting
+    matching_matrix = kernel
+    matching_matrix *= u[:, None]
+    matching_matrix *= v[None, :]
     
-    return matching_matrix
+    return _sinkhorn_result(matching_matrix, result_u, v, iterations, monitor, method)
 
+
+def sinkhorn_matching(
+    scores: np.ndarray,
+    students: list[Student] | StudentTable,
+    lambda_reg: float = 1.0,
+    max_iterations: int = 1000,
+    tolerance: float = 1e-6,
+    method: str = "linear",
+    check_every: int = 10,
+    epsilon_steps: int = 0,
+    init_u: np.ndarray | None = None,
+    init_v: np.ndarray | None = None,
+    return_scalings: bool = False,
+    lazy: bool = False,
+    top_k: int = 50,
+    exclusions: ExclusionIndex | None = None,
+    in_place: bool = False,
+    callback: Callable[[int, float], None] | None = None,
+    capacities: np.ndarray | None = None,
+    marginal_penalty: float | None = None,
+    adaptive: bool = False,
+    stall_patience: int | None = None,
+    dtype: Any = None,
+) -> Any:
+    """
+    Run solve_sinkhorn (same arguments) and return just its plan.
+
+    return_scalings is deprecated: it returns (plan, u, v), which
+    solve_sinkhorn's result already carries.
+    """
+    result = solve_sinkhorn(
+        scores, students, lambda_reg, max_iterations, tolerance, method, check_every,
+        epsilon_steps, init_u, init_v, lazy, top_k, exclusions, in_place, callback,
+        capacities, marginal_penalty, adaptive, stall_patience, dtype,
+    )
+    if return_scalings:
+        warnings.warn(
+            "sinkhorn_matching(return_scalings=True) is deprecated; use solve_sinkhorn and its u and v",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return result.plan, result.u, result.v
+    return result.plan
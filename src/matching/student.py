@@ -1,4 +1,20 @@
+from __future__ import annotations
+
+from typing import Iterable, Mapping
+import numpy as np
+
+CATEGORICAL_FIELDS = ("major", "dorm", "sex")
+_STRING_COLUMNS = ("ids", "first_names", "last_names", "emails", "involvements")
+# dataAccess.ts stores close_friends as bare identifiers and snapshots as full emails
+EMAIL_DOMAIN = "@stanford.edu"
+
+
 class Student:
+    __slots__ = (
+        "id", "first_name", "last_name", "email", "grad_year", "major", "interests",
+        "sex", "dorm", "involvements", "close_friends", "survey_completed",
+    )
+
     def __init__(self, id: str, first_name: str | None, last_name: str | None, email: str, grad_year: int | None, major: str | None, interests: list[str] | None, sex: str | None, dorm: str | None, involvements: str | None, close_friends: list[str] | None, survey_completed: bool):
         self.id = id
         self.first_name = first_name
@@ -12,3 +28,239 @@ class Student:
         self.involvements = involvements
         self.close_friends = close_friends
         self.survey_completed = survey_completed
+
+
+def normalize_key(key: str) -> str:
+    """Canonical email form of a student key: lowercased, with EMAIL_DOMAIN appended to a bare handle."""
+    key = key.strip().lower()
+    return key if "@" in key else key + EMAIL_DOMAIN
+
+
+def row_lookup(ids: list[str], emails: list[str | None]) -> dict[str, int]:
+    """Map each student id, and each normalized email not shadowing an id, to its row."""
+    rows_by_key: dict[str, int] = {}
+    for row, email in enumerate(emails):
+        if email:
+            rows_by_key.setdefault(normalize_key(email), row)
+    for row, student_id in enumerate(ids):
+        rows_by_key[student_id] = row
+    return rows_by_key
+
+
+def lookup_row(rows_by_key: Mapping[str, int], key: str) -> int | None:
+    """Row of a student id, email or bare handle in a row_lookup map, else None."""
+    row = rows_by_key.get(key)
+    return rows_by_key.get(normalize_key(key)) if row is None else row
+
+
+class StudentTable:
+    """
+    Columnar roster: one array or list per Student field instead of one object per student.
+
+    Categorical fields are stored as int32 codes into categories[field]
+    (-1 for unknown). interests and close_friends are CSR-encoded:
+    row i's entries are indices[indptr[i]:indptr[i + 1]], pointing into
+    interest_vocab and into the table rows respectively. close_friends
+    entries that name no student in the table are kept apart, normalized,
+    in a second CSR (external_friend_indptr / external_friend_indices)
+    into external_friends.
+
+    Indexing a table returns a Student built on demand, so code that only
+    touches a few rows (e.g. match extraction) can use it like a list.
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        first_names: list[str | None],
+        last_names: list[str | None],
+        emails: list[str],
+        grad_year: np.ndarray,
+        categories: dict[str, list[str]],
+        codes: dict[str, np.ndarray],
+        interest_vocab: list[str],
+        interest_indptr: np.ndarray,
+        interest_indices: np.ndarray,
+        involvements: list[str | None],
+        friend_indptr: np.ndarray,
+        friend_indices: np.ndarray,
+        survey_completed: np.ndarray,
+        external_friends: list[str] | None = None,
+        external_friend_indptr: np.ndarray | None = None,
+        external_friend_indices: np.ndarray | None = None,
+    ):
+        self.ids = ids
+        self.first_names = first_names
+        self.last_names = last_names
+        self.emails = emails
+        self.grad_year = grad_year
+        self.categories = categories
+        self.codes = codes
+        self.interest_vocab = interest_vocab
+        self.interest_indptr = interest_indptr
+        self.interest_indices = interest_indices
+        self.involvements = involvements
+        self.friend_indptr = friend_indptr
+        self.friend_indices = friend_indices
+        self.survey_completed = survey_completed
+        self.external_friends = external_friends or []
+        self.external_friend_indptr = (
+            np.zeros(len(ids) + 1, dtype=np.int64) if external_friend_indptr is None else external_friend_indptr
+        )
+        self.external_friend_indices = (
+            np.empty(0, dtype=np.int32) if external_friend_indices is None else external_friend_indices
+        )
+
+    @classmethod
+    def from_students(cls, students: Iterable[Student]) -> StudentTable:
+        """Build a table from Student objects; the iterable is consumed once."""
+        ids, first_names, last_names, emails, involvements = [], [], [], [], []
+        grad_year, survey_completed, friend_keys = [], [], []
+        vocabularies: dict[str, dict[str, int]] = {field: {} for field in CATEGORICAL_FIELDS}
+        codes: dict[str, list[int]] = {field: [] for field in CATEGORICAL_FIELDS}
+        interest_vocab: dict[str, int] = {}
+        interest_indptr, interest_indices = [0], []
+
+        for student in students:
+            ids.append(student.id)
+            first_names.append(student.first_name)
+            last_names.append(student.last_name)
+            emails.append(student.email)
+            involvements.append(student.involvements)
+            grad_year.append(np.nan if student.grad_year is None else float(student.grad_year))
+            survey_completed.append(bool(student.survey_completed))
+            for field in CATEGORICAL_FIELDS:
+                value = getattr(student, field)
+                vocabulary = vocabularies[field]
+                codes[field].append(-1 if value is None else vocabulary.setdefault(value, len(vocabulary)))
+            for interest in dict.fromkeys(student.interests or ()):
+                interest_indices.append(interest_vocab.setdefault(interest, len(interest_vocab)))
+            interest_indptr.append(len(interest_indices))
+            friend_keys.append(student.close_friends or ())
+
+        rows_by_key = row_lookup(ids, emails)
+        friend_indptr, friend_indices = [0], []
+        external_friends: dict[str, int] = {}
+        external_indptr, external_indices = [0], []
+        for keys in friend_keys:
+            for key in keys:
+                row = lookup_row(rows_by_key, key)
+                if row is not None:
+                    friend_indices.append(row)
+                else:
+                    key = normalize_key(key)
+                    external_indices.append(external_friends.setdefault(key, len(external_friends)))
+            friend_indptr.append(len(friend_indices))
+            external_indptr.append(len(external_indices))
+
+        return cls(
+            ids=ids,
+            first_names=first_names,
+            last_names=last_names,
+            emails=emails,
+            grad_year=np.array(grad_year, dtype=float),
+            categories={field: list(vocabularies[field]) for field in CATEGORICAL_FIELDS},
+            codes={field: np.array(codes[field], dtype=np.int32) for field in CATEGORICAL_FIELDS},
+            interest_vocab=list(interest_vocab),
+            interest_indptr=np.array(interest_indptr, dtype=np.int64),
+            interest_indices=np.array(interest_indices, dtype=np.int32),
+            involvements=involvements,
+            friend_indptr=np.array(friend_indptr, dtype=np.int64),
+            friend_indices=np.array(friend_indices, dtype=np.int32),
+            survey_completed=np.array(survey_completed, dtype=bool),
+            external_friends=list(external_friends),
+            external_friend_indptr=np.array(external_indptr, dtype=np.int64),
+            external_friend_indices=np.array(external_indices, dtype=np.int32),
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Flatten the table into plain (non-object) NumPy arrays, e.g. for np.savez."""
+        arrays = {
+            "grad_year": self.grad_year,
+            "interest_vocab": np.array(self.interest_vocab, dtype=str),
+            "interest_indptr": self.interest_indptr,
+            "interest_indices": self.interest_indices,
+            "friend_indptr": self.friend_indptr,
+            "friend_indices": self.friend_indices,
+            "survey_completed": self.survey_completed,
+            "external_friends": np.array(self.external_friends, dtype=str),
+            "external_friend_indptr": self.external_friend_indptr,
+            "external_friend_indices": self.external_friend_indices,
+        }
+        for name in _STRING_COLUMNS:
+            values = getattr(self, name)
+            arrays[name] = np.array(["" if v is None else v for v in values], dtype=str)
+            arrays[f"{name}_known"] = np.array([v is not None for v in values], dtype=bool)
+        for field in CATEGORICAL_FIELDS:
+            arrays[f"codes_{field}"] = self.codes[field]
+            arrays[f"categories_{field}"] = np.array(self.categories[field], dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> StudentTable:
+        """Rebuild a table from the output of to_arrays."""
+        columns = {
+            name: [
+                str(value) if known else None
+                for value, known in zip(arrays[name].tolist(), arrays[f"{name}_known"].tolist())
+            ]
+            for name in _STRING_COLUMNS
+        }
+        return cls(
+            ids=columns["ids"],
+            first_names=columns["first_names"],
+            last_names=columns["last_names"],
+            emails=columns["emails"],
+            grad_year=np.asarray(arrays["grad_year"], dtype=float),
+            categories={field: arrays[f"categories_{field}"].tolist() for field in CATEGORICAL_FIELDS},
+            codes={field: np.asarray(arrays[f"codes_{field}"]) for field in CATEGORICAL_FIELDS},
+            interest_vocab=arrays["interest_vocab"].tolist(),
+            interest_indptr=np.asarray(arrays["interest_indptr"]),
+            interest_indices=np.asarray(arrays["interest_indices"]),
+            involvements=columns["involvements"],
+            friend_indptr=np.asarray(arrays["friend_indptr"]),
+            friend_indices=np.asarray(arrays["friend_indices"]),
+            survey_completed=np.asarray(arrays["survey_completed"], dtype=bool),
+            external_friends=arrays["external_friends"].tolist(),
+            external_friend_indptr=np.asarray(arrays["external_friend_indptr"]),
+            external_friend_indices=np.asarray(arrays["external_friend_indices"]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> Student:
+        """Materialize the Student for one row."""
+        student_id = self.ids[row]
+        categorical = {
+            field: None if self.codes[field][row] < 0 else self.categories[field][self.codes[field][row]]
+            for field in CATEGORICAL_FIELDS
+        }
+        interests = self.interest_indices[self.interest_indptr[row]:self.interest_indptr[row + 1]]
+        friends = self.friend_indices[self.friend_indptr[row]:self.friend_indptr[row + 1]]
+        external = self.external_friend_indices[self.external_friend_indptr[row]:self.external_friend_indptr[row + 1]]
+        year = self.grad_year[row]
+        return Student(
+            id=student_id,
+            first_name=self.first_names[row],
+            last_name=self.last_names[row],
+            email=self.emails[row],
+            grad_year=None if np.isnan(year) else int(year),
+            major=categorical["major"],
+            interests=[self.interest_vocab[k] for k in interests] or None,
+            sex=categorical["sex"],
+            dorm=categorical["dorm"],
+            involvements=self.involvements[row],
+            close_friends=[self.ids[k] for k in friends] + [self.external_friends[k] for k in external] or None,
+            survey_completed=bool(self.survey_completed[row]),
+        )
+
+    def friend_edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (row, friend row) edge list of the close_friends CSR."""
+        rows = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.friend_indptr))
+        return rows, self.friend_indices
+
+    def external_friend_edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (row, index into external_friends) edge list of close_friends outside the table."""
+        rows = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.external_friend_indptr))
+        return rows, self.external_friend_indices
@@ -0,0 +1,173 @@
+"""Sinkhorn hyperparameter sweeps over lambda_reg and tolerance on one cost matrix."""
+
+import time
+from pathlib import Path
+import numpy as np
+import experiment
+import loader
+import sinkhorn
+from exclusions import ExclusionIndex
+
+
+def _summarize(plan: np.ndarray, students, lambda_reg: float, tolerance: float, iterations: int, converged: bool, seconds: float) -> dict:
+    matches = experiment.extract_matches(plan, students)
+    positive = plan[plan > 0]
+    return {
+        "lambda_reg": lambda_reg,
+        "tolerance": tolerance,
+        "iterations": iterations,
+        "converged": converged,
+        "seconds": seconds,
+        "total_matches": len(matches),
+        "coverage_percentage": len(matches) * 2 / len(students) * 100 if len(students) else 0.0,
+        "mean_matching_probability": float(positive.mean()) if positive.size else 0.0,
+        "mean_matched_probability": float(np.mean([m["compatibility_score"] for m in matches])) if matches else 0.0,
+    }
+
+
+def _swap(k: int, m: int, *arrays: np.ndarray) -> None:
+    for array in arrays:
+        array[[k, m]] = array[[m, k]]
+
+
+def _solve_batched(
+    kernels: np.ndarray,
+    tolerances: np.ndarray,
+    max_iterations: int,
+    check_every: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run linear Sinkhorn on a stack of kernels at once.
+
+    Configurations that meet their own tolerance are swapped behind the
+    running ones, so later batched products only cover kernels[:running];
+    the stack is put back in its original order before returning.
+
+    Returns:
+        (u, v, iterations, converged, seconds to convergence) per configuration
+    """
+    count, n, _ = kernels.shape
+    u = np.ones((count, n))
+    v = np.ones((count, n))
+    active = (kernels @ np.ones(n)) > 0
+    config = np.arange(count)
+    iterations = np.full(count, max_iterations)
+    converged = np.zeros(count, dtype=bool)
+    seconds = np.zeros(count)
+    swaps = []
+    running = count
+    start = time.perf_counter()
+    for iteration in range(1, max_iterations + 1):
+        batch = kernels[:running]
+        u[:running] = 1.0 / (np.matmul(batch, v[:running, :, None])[:, :, 0] + 1e-16)
+        v[:running] = 1.0 / (np.matmul(u[:running, None, :], batch)[:, 0, :] + 1e-16)
+        if iteration % check_every == 0:
+            row_sums = u[:running] * np.matmul(batch, v[:running, :, None])[:, :, 0]
+            row_error = np.where(active[:running], np.abs(row_sums - 1.0), 0.0).max(axis=1)
+            elapsed = time.perf_counter() - start
+            # Highest slot first, so every swap pulls in a still-running configuration
+            for k in np.flatnonzero(row_error < tolerances[config[:running]])[::-1]:
+                iterations[config[k]] = iteration
+                seconds[config[k]] = elapsed
+                converged[config[k]] = True
+                running -= 1
+                if k != running:
+                    _swap(k, running, kernels, u, v, active, config)
+                    swaps.append((k, running))
+            if running == 0:
+                break
+    seconds[~converged] = time.perf_counter() - start
+    for k, m in reversed(swaps):
+        _swap(k, m, kernels, u, v)
+    return u, v, iterations, converged, seconds
+
+
+def sinkhorn_sweep(
+    scores: np.ndarray,
+    students,
+    lambdas: list[float],
+    tolerance: float | list[float] = 1e-6,
+    max_iterations: int = 1000,
+    check_every: int = 10,
+    batched: bool = False,
+) -> list[dict]:
+    """
+    Solve the matching for several lambda_reg (and tolerance) values.
+
+    The cost matrix and close-friend exclusions are built once and shared by
+    every configuration.
+
+    Args:
+        scores: Score matrix, as for sinkhorn.sinkhorn_matching
+        students: Students or a StudentTable in the order of scores
+        lambdas: lambda_reg values to try
+        tolerance: One tolerance for all, or one per lambda
+        max_iterations: Iteration cap per configuration
+        check_every: Convergence check interval
+        batched: Stack every kernel into one (configs, n, n) array and iterate
+            them together with batched matrix products; needs configs * n^2
+            floats of memory. Otherwise configurations run one after another.
+
+    Returns:
+        One row per configuration with iterations, converged, seconds
+        (wall-clock to convergence, including building the kernel; batched
+        runs build every kernel up front), total_matches, coverage_percentage,
+        mean_matching_probability (over all positive plan entries) and
+        mean_matched_probability (over the extracted matches)
+    """
+    tolerances = np.broadcast_to(np.asarray(tolerance, dtype=float), (len(lambdas),))
+    cost_matrix = ExclusionIndex.from_students(students).apply(np.array(scores, dtype=float))
+
+    if batched:
+        start = time.perf_counter()
+        kernels = np.exp(-np.asarray(lambdas, dtype=float)[:, None, None] * cost_matrix[None, :, :])
+        kernel_seconds = time.perf_counter() - start
+        u, v, iterations, converged, seconds = _solve_batched(kernels, tolerances, max_iterations, check_every)
+        seconds += kernel_seconds
+        plans = kernels
+        plans *= u[:, :, None]
+        plans *= v[:, None, :]
+        return [
+            _summarize(plans[k], students, lambdas[k], float(tolerances[k]), int(iterations[k]), bool(converged[k]), float(seconds[k]))
+            for k in range(len(lambdas))
+        ]
+
+    report = []
+    n = len(students)
+    for lambda_reg, tol in zip(lambdas, tolerances.tolist()):
+        start = time.perf_counter()
+        kernel = np.exp(-lambda_reg * cost_matrix)
+        u, v, iterations = sinkhorn.sinkhorn_scalings(kernel, np.ones(n), np.ones(n), max_iterations, tol, check_every)
+        seconds = time.perf_counter() - start
+        active = kernel.any(axis=1)
+        plan = kernel
+        plan *= u[:, None]
+        plan *= v[None, :]
+        row_error = np.abs(plan.sum(axis=1) - 1.0)[active]
+        converged = row_error.size == 0 or bool(row_error.max() < tol)
+        report.append(_summarize(plan, students, lambda_reg, tol, iterations, converged, seconds))
+    return report
+
+
+def format_report(report: list[dict]) -> str:
+    """Render sweep results as a fixed-width table."""
+    lines = [f"{'lambda':>8}{'tol':>10}{'iters':>7}{'conv':>6}{'seconds':>10}{'matches':>9}{'coverage':>10}{'mean prob':>12}{'matched prob':>14}"]
+    for row in report:
+        lines.append(
+            f"{row['lambda_reg']:>8g}{row['tolerance']:>10.0e}{row['iterations']:>7}"
+            f"{'yes' if row['converged'] else 'no':>6}{row['seconds']:>10.3f}{row['total_matches']:>9}"
+            f"{row['coverage_percentage']:>9.1f}%{row['mean_matching_probability']:>12.4g}"
+            f"{row['mean_matched_probability']:>14.4g}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    mock_dataset_file = Path(__file__).parent / "data" / "mock_dataset.json"
+    students, scores = loader.load_dataset_cached(mock_dataset_file)
+    lambdas = [0.5, 1.0, 2.0, 5.0, 10.0]
+
+    print(f"Sequential sweep on {len(students)} students")
+    print(format_report(sinkhorn_sweep(scores, students, lambdas)))
+    print(f"\nBatched sweep on {len(students)} students")
+    print(format_report(sinkhorn_sweep(scores, students, lambdas, batched=True)))
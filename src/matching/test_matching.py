@@ -0,0 +1,212 @@
+"""Checks of the matching pipeline against brute-force references on small rosters."""
+
+from collections import Counter
+import numpy as np
+import pytest
+import experiment
+import loader
+import roster
+import sinkhorn
+from exclusions import ExclusionIndex
+from incremental import IncrementalMatcher
+
+
+def _roster(n: int = 50, seed: int = 7):
+    """Students (with close friends, so some pairs are excluded) and their score matrix."""
+    dataset = sinkhorn.generate_mock_dataset(n, seed=seed, mean_friends=2.0)
+    students = [loader.parse_student(record) for record in dataset["students"]]
+    return students, sinkhorn.score_matrix(students)
+
+
+def _full_sort_greedy(plan: np.ndarray, students: list, capacities: np.ndarray | None = None) -> Counter:
+    """Greedy matching over every off-diagonal pair sorted by probability."""
+    n = len(students)
+    remaining = np.ones(n, dtype=int) if capacities is None else np.array(capacities, dtype=int)
+    rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+    probs = plan[rows, cols]
+    matched = Counter()
+    for k in np.argsort(-probs, kind="stable"):
+        i, j = rows[k], cols[k]
+        pair = frozenset((students[i].id, students[j].id))
+        if probs[k] > 0 and remaining[i] > 0 and remaining[j] > 0 and pair not in matched:
+            matched[pair] += 1
+            remaining[i] -= 1
+            remaining[j] -= 1
+    return matched
+
+
+def _pairs(matches: list[dict]) -> Counter:
+    return Counter(frozenset((m["student_a_id"], m["student_b_id"])) for m in matches)
+
+
+def _plan(kind: str, students: list, scores: np.ndarray):
+    """A Sinkhorn plan (dense or lazy), or random weights whose best pairs crowd onto a few students."""
+    if kind == "random":
+        rng = np.random.default_rng(3)
+        weights = rng.random(scores.shape) * rng.random(len(students))[None, :] ** 3
+        np.fill_diagonal(weights, 0.0)
+        return weights
+    return sinkhorn.sinkhorn_matching(scores, students, lambda_reg=3.0, lazy=kind == "lazy")
+
+
+@pytest.mark.parametrize("kind", ["dense", "lazy", "random"])
+@pytest.mark.parametrize("top_k,block_size", [(1, 7), (3, 16), (32, 1024)])
+def test_greedy_extraction_equals_full_sort(kind, top_k, block_size):
+    students, scores = _roster()
+    plan = _plan(kind, students, scores)
+    dense = sinkhorn.plan_rows(plan, 0, len(students))
+
+    matches = experiment.extract_matches(plan, students, block_size=block_size, top_k=top_k)
+
+    assert _pairs(matches) == _full_sort_greedy(dense, students)
+
+
+@pytest.mark.parametrize("kind", ["dense", "random"])
+def test_capacity_extraction_equals_full_sort(kind):
+    students, scores = _roster()
+    capacities = np.random.default_rng(5).integers(0, 4, size=len(students))
+    if kind == "random":
+        plan = _plan(kind, students, scores)
+    else:
+        plan = sinkhorn.sinkhorn_matching(scores, students, lambda_reg=3.0, capacities=capacities)
+
+    matches = experiment.extract_matches(plan, students, block_size=16, top_k=3, capacities=capacities)
+
+    assert _pairs(matches) == _full_sort_greedy(plan, students, capacities)
+    counts = Counter(m[key] for m in matches for key in ("student_a_id", "student_b_id"))
+    assert all(counts[s.id] <= c for s, c in zip(students, capacities))
+
+
+@pytest.mark.parametrize("method", ["linear", "log"])
+def test_unbalanced_plan_is_stationary(method):
+    # The KL-relaxed problem minimizes <C, P> + eps * sum(P log P - P)
+    # + rho * (KL(P 1 | a) + KL(P^T 1 | a)) with eps = 1 / lambda_reg; at its
+    # optimum the gradient C + eps * log P + rho * log(r_i / a_i)
+    # + rho * log(c_j / a_j) vanishes on every allowed pair
+    students, scores = _roster()
+    lambda_reg, rho = 2.0, 0.5
+    capacities = np.random.default_rng(5).integers(1, 4, size=len(students)).astype(float)
+    result = sinkhorn.solve_sinkhorn(
+        scores, students, lambda_reg=lambda_reg, method=method, tolerance=1e-12,
+        max_iterations=5000, capacities=capacities, marginal_penalty=rho,
+    )
+    assert result.converged
+    plan = result.plan
+    cost = ExclusionIndex.from_students(students).apply(scores.copy())
+    allowed = np.isfinite(cost)
+    rows, cols = plan.sum(axis=1), plan.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradient = cost + np.log(plan) / lambda_reg
+    gradient += rho * np.log(rows / capacities)[:, None] + rho * np.log(cols / capacities)[None, :]
+
+    assert np.abs(gradient[allowed]).max() < 1e-8
+    # Relaxed, so the capacities are only approximately met
+    assert np.abs(rows - capacities).max() > 1e-3
+
+
+@pytest.mark.parametrize("method", ["linear", "log"])
+@pytest.mark.parametrize("lambda_reg", [3.0, 5.0])
+def test_adaptive_stopping_stops_near_first_converged_iteration(method, lambda_reg):
+    students, scores = _roster()
+
+    def solve(**kwargs):
+        return sinkhorn.solve_sinkhorn(scores, students, lambda_reg=lambda_reg, method=method, max_iterations=5000, **kwargs)
+
+    # Checking every iteration finds the first one that meets the tolerance
+    reference = solve(check_every=1)
+    fixed = solve(check_every=10)
+    adaptive = solve(check_every=10, adaptive=True)
+
+    assert reference.converged and adaptive.converged
+    assert reference.iterations <= adaptive.iterations <= fixed.iterations
+    assert adaptive.iterations - reference.iterations <= 2
+    errors = dict(reference.errors)
+    for iteration, error in adaptive.errors:
+        assert error == pytest.approx(errors[iteration], rel=1e-9)
+
+
+def test_remove_student_matches_rebuild():
+    students, _ = _roster()
+    matcher = IncrementalMatcher(students, lambda_reg=2.0, tolerance=1e-10, max_iterations=5000)
+    # A middle row (swapped with the last), the last row itself, then row 0
+    for student_id in (students[17].id, matcher.students[-1].id, students[0].id):
+        matcher.remove_student(student_id)
+    fresh = IncrementalMatcher(matcher.students, lambda_reg=2.0, tolerance=1e-10, max_iterations=5000)
+
+    assert [s.id for s in matcher.students] == [s.id for s in fresh.students]
+    assert matcher.rows_by_id == fresh.rows_by_id
+    np.testing.assert_array_equal(matcher.scores, fresh.scores)
+    np.testing.assert_array_equal(matcher.kernel, fresh.kernel)
+    n = len(matcher)
+    np.testing.assert_allclose(sinkhorn.plan_rows(matcher.plan(), 0, n), sinkhorn.plan_rows(fresh.plan(), 0, n), atol=1e-8)
+
+
+def _signups(n: int = 50, seed: int = 11) -> list:
+    """Students as the signup flow stores them: opaque ids, close_friends as bare (mixed-case) handles."""
+    students, _ = _roster(n, seed)
+    handles = {s.id: s.email.split("@")[0] for s in students}
+    for k, s in enumerate(students):
+        s.close_friends = [handles[f].capitalize() if k % 2 else handles[f] for f in s.close_friends or ()]
+        s.id = f"00000000-0000-4000-8000-{k:012d}"
+    return students
+
+
+def test_refreshed_rows_match_rebuild():
+    students = _signups()
+    assert any(s.close_friends for s in students)
+    matcher = IncrementalMatcher(students[:40], lambda_reg=2.0)
+    for student in students[40:]:
+        matcher.add_student(student, solve=False)
+    for student in students[::7]:
+        matcher.update_student(student, solve=False)
+    matcher.remove_student(students[3].id, solve=False)
+    fresh = IncrementalMatcher(matcher.students, lambda_reg=2.0)
+
+    np.testing.assert_array_equal(matcher.scores, fresh.scores)
+    np.testing.assert_array_equal(matcher.kernel, fresh.kernel)
+    assert (fresh.kernel == 0).sum() > len(fresh)
+
+
+@pytest.mark.parametrize("lambda_reg", [3.0, 60.0])
+def test_float32_scalings_rebuild_plan(lambda_reg):
+    students, scores = _roster()
+    result = sinkhorn.solve_sinkhorn(scores, students, lambda_reg=lambda_reg, dtype=np.float32)
+    reference = sinkhorn.solve_sinkhorn(scores, students, lambda_reg=lambda_reg)
+    cost = ExclusionIndex.from_students(students).apply(scores.copy())
+
+    # u scales the unshifted kernel, whatever row shift the solve used
+    with np.errstate(under="ignore"):
+        kernel = np.exp(-lambda_reg * cost)
+    rebuilt = result.u.astype(float)[:, None] * kernel * result.v.astype(float)[None, :]
+    np.testing.assert_allclose(rebuilt, result.plan, rtol=1e-4, atol=1e-7)
+    np.testing.assert_allclose(result.plan, reference.plan, atol=1e-4)
+    assert result.v.dtype == (np.float64 if lambda_reg > 20 else np.float32)
+
+
+def test_table_cache_is_keyed_by_roster(tmp_path, monkeypatch):
+    dataset = sinkhorn.generate_mock_dataset(5, seed=1)
+    records = dataset["students"]
+    records[0]["close_friends"] = [f"{records[1]['first_name']} {records[1]['last_name']}"]
+    path = tmp_path / "students.json"
+    loader.save_local_dataset(dataset, path)
+    roster_path = tmp_path / "roster.csv"
+
+    def load(friend: int, cached: bool):
+        """Row 0's friend rows, with the roster sending row 1's name to row friend's email."""
+        roster_path.write_text(
+            f"first_name,middle_name,last_name,email\n{records[1]['first_name']},,{records[1]['last_name']},{records[friend]['email']}\n",
+            encoding="utf-8",
+        )
+        index = roster.load_roster_index(roster_path)
+        with monkeypatch.context() as patch:
+            if cached:
+                patch.setattr(loader, "load_student_table", None)
+            table, _ = loader.load_table_cached(path, roster=index)
+        return table.friend_indices[table.friend_indptr[0]:table.friend_indptr[1]].tolist()
+
+    table, _ = loader.load_table_cached(path)
+    assert table.friend_indptr[1] == 0
+    assert load(1, cached=False) == [1]
+    assert load(1, cached=True) == [1]
+    assert load(2, cached=False) == [2]
@@ -1,112 +1,171 @@
-import networkx as nx
-import matplotlib.pyplot as plt
-import imageio
-import random
-import os
-
-# Generate 30 nodes
-num_nodes = 30
-nodes = list(range(num_nodes))
-
-# Generate random edges (approximately 2-3 edges per node for a connected graph)
-num_edges = random.randint(40, 60)
-edges_ordered = []
-possible_edges = [(i, j) for i in range(num_nodes) for j in range(i + 1, num_nodes)]
-random.shuffle(possible_edges)
-edges_ordered = possible_edges[:num_edges]
-
-# Create graph with all nodes to get consistent layout
-G = nx.Graph()
-G.add_nodes_from(nodes)
-G.add_edges_from(edges_ordered)
-
-# Freeze layout for consistency - use larger k for more spread out nodes
-pos = nx.spring_layout(G, k=1.5, iterations=50, seed=42)
-
-# Normalize positions to cover the entire canvas
-x_coords = [pos[node][0] for node in nodes]
-y_coords = [pos[node][1] for node in nodes]
-x_min, x_max = min(x_coords), max(x_coords)
-y_min, y_max = min(y_coords), max(y_coords)
-x_range = x_max - x_min if x_max != x_min else 1
-y_range = y_max - y_min if y_max != y_min else 1
-max_range = max(x_range, y_range) * 0.85  # Use most of the canvas, spreading nodes out
-
-# Normalize all positions to cover entire square
-for node in nodes:
-    pos[node] = (
-        (pos[node][0] - (x_min + x_max) / 2) / max_range,
-        (pos[node][1] - (y_min + y_max) / 2) / max_range
-    )
-
-# Split edges: 70% static, 30% animating
-static_edges_count = int(len(edges_ordered) * 0.7)
-static_edges = edges_ordered[:static_edges_count]
-animating_edges = edges_ordered[static_edges_count:]
-
-# Animation parameters
-frames_per_edge = 7  # Frames to fully draw each edge (3x faster than before)
-frames_between_starts = 2  # Frames between starting each new edge animation
+"""Render the landing page hero GIF: a random network whose edges draw themselves in."""
 
-frames = []
-
-# Create frames directory if it doesn't exist
-media_dir = "src/network/media"
-os.makedirs(media_dir, exist_ok=True)
-
-# Calculate total frames needed
-total_frames = len(animating_edges) * frames_between_starts + frames_per_edge
-
-for frame_idx in range(total_frames + 1):
-    fig, ax = plt.subplots(figsize=(5,5))
-    ax.set_xlim(-1.05, 1.05)
-    ax.set_ylim(-1.05, 1.05)
+import argparse
+import os
+import random
+import imageio
+import networkx as nx
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+DEFAULT_MEDIA_DIR = "src/network/media"
+
+
+def random_edges(num_nodes, num_edges, rng):
+    """Draw num_edges distinct undirected (i, j) pairs with i < j, in random order."""
+    max_edges = num_nodes * (num_nodes - 1) // 2
+    if num_edges > max_edges:
+        raise ValueError(f"{num_nodes} nodes allow at most {max_edges} edges, got {num_edges}")
+    edges = {}
+    while len(edges) < num_edges:
+        i, j = sorted(rng.sample(range(num_nodes), 2))
+        edges.setdefault((i, j), None)
+    return list(edges)
+
+
+def normalized_layout(num_nodes, edges):
+    """Spring layout scaled so the nodes cover most of the [-1, 1] square; returns an (n, 2) array."""
+    G = nx.Graph()
+    G.add_nodes_from(range(num_nodes))
+    G.add_edges_from(edges)
+
+    # Freeze layout for consistency - use larger k for more spread out nodes
+    pos = nx.spring_layout(G, k=1.5, iterations=50, seed=42)
+    coords = np.array([pos[node] for node in range(num_nodes)])
+
+    # Normalize positions to cover the entire canvas
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    ranges = np.where(hi != lo, hi - lo, 1)
+    max_range = ranges.max() * 0.85  # Use most of the canvas, spreading nodes out
+    return (coords - (lo + hi) / 2) / max_range
+
+
+def render_frames(
+    coords,
+    static_edges,
+    animating_edges,
+    frames_per_edge=7,
+    frames_between_starts=2,
+    size=5,
+    dpi=150,
+):
+    """
+    Yield each animation frame as an (H, W, 3) uint8 array.
+
+    One figure is reused for every frame. Nodes and static edges are drawn
+    once and kept as a background; each frame restores that background and
+    redraws only the growing edges, then copies the canvas buffer.
+    """
+    fig = Figure(figsize=(size, size), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0, 1, 1))
+    # Crop to the nodes, as savefig(bbox_inches='tight') used to
+    limit = np.abs(coords).max() + 0.05
+    ax.set_xlim(-limit, limit)
+    ax.set_ylim(-limit, limit)
     ax.set_aspect('equal')
     ax.axis("off")
 
-    # Create graph with static edges
-    Gtemp = nx.Graph()
-    Gtemp.add_nodes_from(nodes)
-    Gtemp.add_edges_from(static_edges)
-
-    # Draw static edges and nodes
-    nx.draw_networkx_nodes(Gtemp, pos, node_color="skyblue", node_size=100, ax=ax)
-    nx.draw_networkx_edges(Gtemp, pos, edgelist=static_edges, edge_color="black", width=2, ax=ax)
-    
-    # Draw animating edges progressively
-    for i, edge in enumerate(animating_edges):
-        start_frame = i * frames_between_starts
-        end_frame = start_frame + frames_per_edge
-        
-        if frame_idx >= start_frame:
-            # Calculate progress (0 to 1)
-            progress = min(1.0, (frame_idx - start_frame) / frames_per_edge)
-            
-            # Get node positions
-            x1, y1 = pos[edge[0]]
-            x2, y2 = pos[edge[1]]
-            
-            # Calculate point along the edge based on progress
-            x_end = x1 + (x2 - x1) * progress
-            y_end = y1 + (y2 - y1) * progress
-            
-            # Draw the partial edge
-            ax.plot([x1, x_end], [y1, y_end], 'k-', linewidth=2, color='black')
-
-    # Save frame
-    fname = os.path.join(media_dir, f"frame_{frame_idx}.png")
-    fig.savefig(fname, dpi=150, bbox_inches='tight', pad_inches=0)
-    plt.close(fig)
-    frames.append(imageio.imread(fname))
-
-# Write GIF (overwrites existing file)
-gif_path = os.path.join(media_dir, "network_growth.gif")
-if os.path.exists(gif_path):
-    os.remove(gif_path)
-imageio.mimsave(gif_path, frames, duration=0.1, loop=0)
-
-# Clean up individual frame files
-for i in range(len(frames)):
-    frame_path = os.path.join(media_dir, f"frame_{i}.png")
-    if os.path.exists(frame_path):
-        os.remove(frame_path)
+    # Static layer
+    static = np.asarray(static_edges, dtype=int).reshape(-1, 2)
+    ax.add_collection(LineCollection(coords[static], colors="black", linewidths=2, zorder=1))
+    ax.scatter(coords[:, 0], coords[:, 1], s=100, c="skyblue", zorder=2)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    # Animating layer, drawn on top of the nodes
+    animating = np.asarray(animating_edges, dtype=int).reshape(-1, 2)
+    starts = coords[animating[:, 0]]
+    deltas = coords[animating[:, 1]] - starts
+    start_frames = np.arange(len(animating)) * frames_between_starts
+    growing = LineCollection([], colors="black", linewidths=2, zorder=3)
+    ax.add_collection(growing)
+
+    total_frames = len(animating) * frames_between_starts + frames_per_edge
+    for frame_idx in range(total_frames + 1):
+        visible = frame_idx >= start_frames
+        # Progress (0 to 1) along each edge that has started
+        progress = np.minimum(1.0, (frame_idx - start_frames[visible]) / frames_per_edge)
+        ends = starts[visible] + deltas[visible] * progress[:, None]
+        growing.set_segments(np.stack([starts[visible], ends], axis=1))
+
+        canvas.restore_region(background)
+        ax.draw_artist(growing)
+        yield np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+
+def generate_gif(
+    output_path,
+    num_nodes=30,
+    num_edges=None,
+    static_fraction=0.7,
+    frames_per_edge=7,
+    frames_between_starts=2,
+    size=5,
+    dpi=150,
+    duration=0.1,
+    seed=None,
+):
+    """
+    Write the network growth GIF to output_path.
+
+    Frames go straight from the canvas buffer to the GIF writer, so nothing
+    is written to disk except the GIF itself.
+
+    Args:
+        output_path: GIF file to write (overwritten if present)
+        num_nodes: Number of nodes
+        num_edges: Number of edges; defaults to a random count between 4/3
+            and 2 edges per node (40 to 60 for 30 nodes)
+        static_fraction: Share of edges drawn from the first frame; the rest
+            animate in one after another
+        frames_per_edge: Frames to fully draw each edge
+        frames_between_starts: Frames between starting each new edge animation
+        size: Figure width and height in inches
+        dpi: Resolution of each frame
+        duration: Seconds per frame
+        seed: Seed for the random edges
+    """
+    rng = random.Random(seed)
+    if num_edges is None:
+        num_edges = rng.randint(4 * num_nodes // 3, 2 * num_nodes)
+    edges = random_edges(num_nodes, num_edges, rng)
+    coords = normalized_layout(num_nodes, edges)
+
+    static_edges_count = int(len(edges) * static_fraction)
+    static_edges = edges[:static_edges_count]
+    animating_edges = edges[static_edges_count:]
+
+    frames = render_frames(coords, static_edges, animating_edges, frames_per_edge, frames_between_starts, size, dpi)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with imageio.get_writer(output_path, mode="I", duration=duration, loop=0) as writer:
+        for frame in frames:
+            writer.append_data(frame)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=30, help="Number of nodes")
+    parser.add_argument("--edges", type=int, help="Number of edges (default: random, 4/3 to 2 per node)")
+    parser.add_argument("--static-fraction", type=float, default=0.7, help="Share of edges shown from the start")
+    parser.add_argument("--frames-per-edge", type=int, default=7)
+    parser.add_argument("--frames-between-starts", type=int, default=2)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--seed", type=int, help="Seed for the random edges")
+    parser.add_argument("--output", default=os.path.join(DEFAULT_MEDIA_DIR, "network_growth.gif"))
+    args = parser.parse_args()
+
+    path = generate_gif(
+        args.output,
+        num_nodes=args.nodes,
+        num_edges=args.edges,
+        static_fraction=args.static_fraction,
+        frames_per_edge=args.frames_per_edge,
+        frames_between_starts=args.frames_between_starts,
+        dpi=args.dpi,
+        seed=args.seed,
+    )
+    print(f"Saved {path}")